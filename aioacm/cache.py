@@ -0,0 +1,91 @@
+# coding: utf8
+
+import time
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger("aioacm")
+
+
+class ConfigCache:
+    """In-memory LRU cache of config contents with an optional TTL.
+
+    :param maxsize: max number of items kept, least recently used items
+                    are evicted first.
+    :param ttl: seconds an item stays valid, ``None`` for no expiration.
+    """
+
+    def __init__(self, maxsize, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def get(self, key, default=None):
+        item = self.items.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+        content, expire_at = item
+        if expire_at is not None and expire_at <= time.monotonic():
+            del self.items[key]
+            self.misses += 1
+            self.evictions += 1
+            return default
+        self.items.move_to_end(key)
+        self.hits += 1
+        return content
+
+    def get_stale(self, key, max_stale, default=None):
+        """Get `key`, or its expired content if it expired at most
+        `max_stale` seconds ago.
+
+        :return: content and whether it is expired, `default` and True if
+                 `key` is missing.
+        """
+        item = self.items.get(key)
+        if item is None:
+            self.misses += 1
+            return default, True
+        content, expire_at = item
+        now = time.monotonic()
+        expired = expire_at is not None and expire_at <= now
+        if expired and expire_at + max_stale <= now:
+            del self.items[key]
+            self.misses += 1
+            self.evictions += 1
+            return default, True
+        self.items.move_to_end(key)
+        self.hits += 1
+        return content, expired
+
+    def put(self, key, content):
+        expire_at = time.monotonic() + self.ttl if self.ttl else None
+        self.items[key] = (content, expire_at)
+        self.items.move_to_end(key)
+        while len(self.items) > self.maxsize:
+            evicted, _ = self.items.popitem(last=False)
+            self.evictions += 1
+            logger.debug("[config-cache] %s is evicted", evicted)
+
+    def invalidate(self, key):
+        self.items.pop(key, None)
+
+    def clear(self):
+        self.items.clear()
+
+    def stats(self):
+        return {
+            "size": len(self.items),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -6,22 +6,28 @@ import json
 import time
 import base64
 import asyncio
+import random
 import hashlib
 import logging
 from http import HTTPStatus
-from asyncio import iscoroutinefunction
 from functools import partial
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from urllib.error import URLError, HTTPError
 from urllib.parse import urlencode, unquote_plus
 
-# Non Standard Library
-from aiohttp import ClientError, ClientSession, ClientResponseError
-
 # Current Project
-from .files import read_file, save_file, delete_file
-from .params import is_valid, group_key, parse_key
+from .cache import ConfigCache
+from .files import read_file_async, save_file_async, delete_file_async, file_age_async
+from .params import is_valid, parse_key, ConfigKey
 from .server import get_server_list
 from .commons import truncate, synchronized_with_attr
+from .dispatcher import CallbackDispatcher, callback_name
+from .pool import PullerPool
+from .watchers import WatcherMapping
+from .selector import ServerSelector
+from .hedge import Hedger
+from . import envelope
 
 DEBUG = False
 VERSION = "0.3.13"
@@ -32,16 +38,31 @@ DEFAULT_NAMESPACE = ""
 WORD_SEPARATOR = u'\x02'
 LINE_SEPARATOR = u'\x01'
 
-kms_available = False
+logger = logging.getLogger("aioacm")
+
+_kms_sdk = None
+
+
+def load_kms_sdk():
+    """Import the Aliyun KMS SDK on first use, it is slow to import.
 
-try:
-    from aliyunsdkcore.client import AcsClient
-    from aliyunsdkkms.request.v20160120.DecryptRequest import DecryptRequest
-    from aliyunsdkkms.request.v20160120.EncryptRequest import EncryptRequest
+    :return: (AcsClient, EncryptRequest, DecryptRequest,
+             GenerateDataKeyRequest), None if the SDK is not installed.
+    """
+    global _kms_sdk
+    if _kms_sdk is None:
+        try:
+            from aliyunsdkcore.client import AcsClient
+            from aliyunsdkkms.request.v20160120.DecryptRequest import DecryptRequest
+            from aliyunsdkkms.request.v20160120.EncryptRequest import EncryptRequest
+            from aliyunsdkkms.request.v20160120.GenerateDataKeyRequest import GenerateDataKeyRequest
+
+            _kms_sdk = (AcsClient, EncryptRequest, DecryptRequest, GenerateDataKeyRequest)
+        except ImportError:
+            logger.info("Aliyun KMS SDK is not installed")
+            _kms_sdk = ()
+    return _kms_sdk or None
 
-    kms_available = True
-except ImportError:
-    logger.info("Aliyun KMS SDK is not installed")
 
 ENCRYPTED_DATA_ID_PREFIX = "cipher-"
 
@@ -56,6 +77,30 @@ DEFAULTS = {
     "KMS_ENABLED": False,
     "REGION_ID": "",
     "KEY_ID": "",
+    "POOL_SIZE": 100,
+    "POOL_SIZE_PER_HOST": 32,
+    "KEEPALIVE_TIMEOUT": 30,  # in seconds
+    "CACHE_SIZE": 1000,
+    "CACHE_TTL": 300,  # in seconds
+    "FILE_IO_THREAD_NUM": 4,
+    "KMS_THREAD_NUM": 4,
+    "KMS_CACHE_SIZE": 1000,
+    "KMS_ENVELOPE_ENABLED": False,
+    "DATA_KEY_LIFETIME": 3600,  # in seconds
+    "GET_MANY_CONCURRENCY": 16,
+    "LIST_PAGE_SIZE": 200,
+    "LIST_CONCURRENCY": 8,
+    "PULLING_REFETCH_CONCURRENCY": 16,
+    "WARM_VALUES_TTL": 10,  # in seconds
+    "SERVER_EWMA_ALPHA": 0.3,
+    "SERVER_EXPLORE_INTERVAL": 10,  # in seconds
+    "BREAKER_THRESHOLD": 3,
+    "BREAKER_COOLDOWN": 1,  # in seconds
+    "BREAKER_MAX_COOLDOWN": 60,  # in seconds
+    "PULLING_BACKOFF": 1,  # in seconds
+    "PULLING_MAX_BACKOFF": 30,  # in seconds
+    "HEDGE_PERCENTILE": 0.99,
+    "HEDGE_BUDGET": 0.05,
 }
 
 OPTIONS = set((
@@ -74,10 +119,38 @@ OPTIONS = set((
     "kms_ak",
     "kms_secret",
     "key_id",
-    "no_snapshot"
+    "no_snapshot",
+    "max_staleness",
+    "pool_size",
+    "pool_size_per_host",
+    "keepalive_timeout",
+    "cache_enabled",
+    "keep_watched_content",
+    "server_ewma_alpha",
+    "server_explore_interval",
+    "breaker_threshold",
+    "breaker_cooldown",
+    "breaker_max_cooldown",
+    "pulling_backoff",
+    "pulling_max_backoff",
+    "hedge_enabled",
+    "hedge_percentile",
+    "hedge_budget",
+    "cache_size",
+    "cache_ttl",
+    "file_io_thread_num",
+    "kms_thread_num",
+    "kms_cache_size",
+    "kms_envelope_enabled",
+    "data_key_lifetime",
+    "get_many_concurrency",
+    "list_page_size",
+    "list_concurrency",
+    "pulling_refetch_concurrency",
+    "warm_values_ttl",
 ))
 
-_FUTURES = []
+_MISSING = object()
 
 
 class ACMException(Exception):
@@ -102,6 +175,22 @@ def process_common_params(data_id, group):
     return data_id, group
 
 
+def parse_retry_after(headers):
+    """Seconds to wait given by a Retry-After header, None if there is none."""
+    value = headers.get("Retry-After") if headers else None
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    from email.utils import parsedate_to_datetime
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
 def parse_pulling_result(result):
     if not result:
         return list()
@@ -120,18 +209,12 @@ def is_encrypted(data_id):
     return data_id.startswith(ENCRYPTED_DATA_ID_PREFIX)
 
 
-class WatcherWrap:
-    def __init__(self, key, callback):
-        self.callback = callback
-        self.last_md5 = None
-        self.watch_key = key
-
-
 class CacheData:
-    def __init__(self, key, client):
+    __slots__ = ("key", "probe", "content", "_md5", "is_init")
+
+    def __init__(self, key, local_value):
         self.key = key
-        local_value = read_file(client.failover_base, key) or \
-            read_file(client.snapshot_base, key)
+        self.probe = None
         self.content = local_value
         if isinstance(local_value, bytes):
             src = local_value.decode("utf8")
@@ -145,6 +228,124 @@ class CacheData:
                 key
             )
 
+    @property
+    def md5(self):
+        return self._md5
+
+    @md5.setter
+    def md5(self, value):
+        self._md5 = value
+        self.probe = None
+
+    def probe_line(self):
+        """Line of the key in Probe-Modify-Request, cached until md5 changes."""
+        if self.probe is None:
+            data_id, group, namespace = parse_key(self.key)
+            self.probe = WORD_SEPARATOR.join(
+                [data_id, group, self._md5 or "", namespace]
+            ) + LINE_SEPARATOR
+        return self.probe
+
+    @classmethod
+    async def load(cls, key, client):
+        """Init cache data from failover or snapshot file."""
+        local_value = await client._read_file(client.failover_base, key) or \
+            await client._read_file(client.snapshot_base, key)
+        return cls(key, local_value)
+
+
+class ConfigIterator:
+    """Async iterator over config items of a namespace, page by page.
+
+    At most `read_ahead` pages are requested ahead of the consumer, so memory
+    stays flat no matter how many items the namespace has. Use it as an async
+    context manager to cancel pages requested ahead if the consumer stops
+    early.
+    """
+
+    def __init__(self, client, group=None, prefix=None, with_content=True,
+                 read_ahead=1, page_size=200):
+        self.client = client
+        self.group = group
+        self.prefix = prefix
+        self.with_content = with_content
+        self.read_ahead = max(read_ahead, 1)
+        self.page_size = page_size
+        self.total_count = None
+        self.pages_available = None
+        self._next_page = 1
+        self._fetching = deque()
+        self._items = deque()
+
+    def __aiter__(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
+
+    async def aclose(self):
+        """Close as `close`, for `contextlib.aclosing`."""
+        self.close()
+
+    async def __anext__(self):
+        while not self._items:
+            self._schedule()
+            if not self._fetching:
+                raise StopAsyncIteration
+            try:
+                result = await self._fetching.popleft()
+            except BaseException:
+                self.close()
+                raise
+            if not result:
+                logging.getLogger("aioacm.iter-config").warning(
+                    "can not get config items of %s",
+                    self.client.namespace
+                )
+                self.close()
+                raise StopAsyncIteration
+            if self.pages_available is None:
+                self.total_count = result["totalCount"]
+                self.pages_available = result["pagesAvailable"]
+            self._fill(result["pageItems"])
+            # request following pages while the consumer works on this one
+            self._schedule()
+        return self._items.popleft()
+
+    def _schedule(self):
+        # the first page tells how many pages are available
+        last_page = 1 if self.pages_available is None else self.pages_available
+        while len(self._fetching) < self.read_ahead and \
+                self._next_page <= last_page:
+            self._fetching.append(asyncio.ensure_future(
+                self.client.list(self._next_page, self.page_size)
+            ))
+            self._next_page += 1
+
+    def _fill(self, page_items):
+        for i in page_items:
+            if self.group is not None and i["group"] != self.group:
+                continue
+            if self.prefix is not None and not i["dataId"].startswith(self.prefix):
+                continue
+            item = {"dataId": i["dataId"], "group": i["group"]}
+            if self.with_content:
+                item["content"] = i.get("content")
+                item["md5"] = i.get("md5")
+            self._items.append(item)
+
+    def close(self):
+        """Cancel pages requested ahead but not consumed."""
+        while self._fetching:
+            future = self._fetching.popleft()
+            future.cancel()
+            # a page failed already is not reported as never retrieved
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._next_page = float("inf")
+
 
 class ACMClient:
     """Client for ACM
@@ -180,12 +381,17 @@ class ACMClient:
         self.current_server = None
         self.server_offset = 0
         self.server_refresh_running = False
+        self.session = None
+        self.background_futures = set()
 
-        self.watcher_mapping = dict()
+        self.watcher_mapping = WatcherMapping()
+        self.config_keys = dict()
+        self.warm_values = dict()
+        self.warm_deadlines = dict()
         self.pulling_lock = asyncio.Lock()
-        self.puller_mapping = None
+        self.puller_pool = None
         self.notify_queue = None
-        self.callback_tread_pool = None
+        self.callback_dispatcher = None
         self.process_mgr = None
 
         self.default_timeout = DEFAULTS["TIMEOUT"]
@@ -194,7 +400,7 @@ class ACMClient:
         self.cai_enabled = True
         self.pulling_timeout = DEFAULTS["PULLING_TIMEOUT"]
         self.pulling_config_size = DEFAULTS["PULLING_CONFIG_SIZE"]
-        self.callback_tread_num = DEFAULTS["CALLBACK_THREAD_NUM"]
+        self.callback_thread_num = DEFAULTS["CALLBACK_THREAD_NUM"]
         self.failover_base = DEFAULTS["FAILOVER_BASE"]
         self.snapshot_base = DEFAULTS["SNAPSHOT_BASE"]
         self.app_name = DEFAULTS["APP_NAME"]
@@ -205,6 +411,47 @@ class ACMClient:
         self.kms_secret = self.sk
         self.kms_client = None
         self.no_snapshot = False
+        self.pool_size = DEFAULTS["POOL_SIZE"]
+        self.pool_size_per_host = DEFAULTS["POOL_SIZE_PER_HOST"]
+        self.keepalive_timeout = DEFAULTS["KEEPALIVE_TIMEOUT"]
+        self.cache_enabled = False
+        self.keep_watched_content = True
+        self.cache_size = DEFAULTS["CACHE_SIZE"]
+        self.cache_ttl = DEFAULTS["CACHE_TTL"]
+        self.config_cache = None
+        self.get_flights = dict()
+        self.get_flight_count = 0
+        self.get_coalesced_count = 0
+        self.get_stale_count = 0
+        self.max_staleness = None
+        self.file_io_thread_num = DEFAULTS["FILE_IO_THREAD_NUM"]
+        self.kms_thread_num = DEFAULTS["KMS_THREAD_NUM"]
+        self.kms_executor = None
+        self.kms_cache_size = DEFAULTS["KMS_CACHE_SIZE"]
+        self.kms_cache = None
+        self.kms_envelope_enabled = DEFAULTS["KMS_ENVELOPE_ENABLED"]
+        self.data_key_lifetime = DEFAULTS["DATA_KEY_LIFETIME"]
+        self.data_key = None
+        self.data_key_lock = asyncio.Lock()
+        self.data_key_flights = dict()
+        self.file_executor = None
+        self.get_many_concurrency = DEFAULTS["GET_MANY_CONCURRENCY"]
+        self.list_page_size = DEFAULTS["LIST_PAGE_SIZE"]
+        self.list_concurrency = DEFAULTS["LIST_CONCURRENCY"]
+        self.pulling_refetch_concurrency = DEFAULTS["PULLING_REFETCH_CONCURRENCY"]
+        self.warm_values_ttl = DEFAULTS["WARM_VALUES_TTL"]
+        self.server_ewma_alpha = DEFAULTS["SERVER_EWMA_ALPHA"]
+        self.server_explore_interval = DEFAULTS["SERVER_EXPLORE_INTERVAL"]
+        self.breaker_threshold = DEFAULTS["BREAKER_THRESHOLD"]
+        self.breaker_cooldown = DEFAULTS["BREAKER_COOLDOWN"]
+        self.breaker_max_cooldown = DEFAULTS["BREAKER_MAX_COOLDOWN"]
+        self.pulling_backoff = DEFAULTS["PULLING_BACKOFF"]
+        self.pulling_max_backoff = DEFAULTS["PULLING_MAX_BACKOFF"]
+        self.server_selector = None
+        self.hedge_enabled = False
+        self.hedge_percentile = DEFAULTS["HEDGE_PERCENTILE"]
+        self.hedge_budget = DEFAULTS["HEDGE_BUDGET"]
+        self.hedger = None
 
         logging.getLogger('aioacm.client-init').info(
             "endpoint:%s, tenant:%s",
@@ -219,13 +466,254 @@ class ACMClient:
                 logger.warning("unknown option:%s, ignored" % k)
                 continue
 
-            if k == "kms_enabled" and v and not kms_available:
+            if k == "kms_enabled" and v and not load_kms_sdk():
                 logger.warning("kms can not be turned on with no KMS SDK installed")
                 continue
 
+            if k == "kms_envelope_enabled" and v and not envelope.load_aesgcm():
+                logger.warning("envelope encryption can not be turned on with no cryptography installed")
+                continue
+
             logger.debug("key:%s, value:%s" % (k, v))
             setattr(self, k, v)
 
+    def _get_session(self):
+        """Get the pooled session shared by every request of this client.
+
+        The session is created on first use, so it is bound to the running
+        loop, and connections are kept alive between requests.
+        """
+        if self.session is None or self.session.closed:
+            from aiohttp import ClientSession, TCPConnector
+            connector = TCPConnector(
+                limit=self.pool_size,
+                limit_per_host=self.pool_size_per_host,
+                keepalive_timeout=self.keepalive_timeout
+            )
+            self.session = ClientSession(connector=connector)
+        return self.session
+
+    def _get_cache(self):
+        """Get the in-memory config cache, None if cache is not enabled."""
+        if not self.cache_enabled:
+            return None
+        if self.config_cache is None:
+            self.config_cache = ConfigCache(self.cache_size, self.cache_ttl)
+        return self.config_cache
+
+    def _get_selector(self):
+        if self.server_selector is None:
+            self.server_selector = ServerSelector(
+                self.server_ewma_alpha,
+                self.server_explore_interval,
+                breaker_threshold=self.breaker_threshold,
+                breaker_cooldown=self.breaker_cooldown,
+                breaker_max_cooldown=self.breaker_max_cooldown
+            )
+        return self.server_selector
+
+    def _get_hedger(self):
+        if self.hedger is None:
+            self.hedger = Hedger(self.hedge_percentile, self.hedge_budget)
+        return self.hedger
+
+    def _config_key(self, data_id, group):
+        """Key of an item, the interned one if the item is watched."""
+        # plain tuples hash and compare equal to ConfigKey
+        key = self.config_keys.get((data_id, group, self.namespace))
+        return key if key is not None else ConfigKey(data_id, group, self.namespace)
+
+    def _invalidate_cache(self, cache_key):
+        if self.config_cache is not None:
+            self.config_cache.invalidate(cache_key)
+
+    def _get_file_executor(self):
+        if self.file_executor is None:
+            self.file_executor = ThreadPoolExecutor(
+                max_workers=self.file_io_thread_num
+            )
+        return self.file_executor
+
+    def _get_kms_executor(self):
+        if self.kms_executor is None:
+            self.kms_executor = ThreadPoolExecutor(
+                max_workers=self.kms_thread_num
+            )
+        return self.kms_executor
+
+    def _get_kms_cache(self):
+        """Get the cache of plaintexts by digest of ciphertext, None if
+        `kms_cache_size` is 0.
+        """
+        if not self.kms_cache_size:
+            return None
+        if self.kms_cache is None:
+            self.kms_cache = ConfigCache(self.kms_cache_size)
+        return self.kms_cache
+
+    async def _get_data_key(self):
+        """Get the data key of envelopes, a new one is generated by KMS when
+        the current one is older than `data_key_lifetime`.
+
+        :return: (data key, data key wrapped by KMS).
+        """
+        async with self.data_key_lock:
+            if self.data_key is None or time.monotonic() >= self.data_key[2]:
+                data_key, wrapped = await asyncio.get_event_loop().run_in_executor(
+                    self._get_kms_executor(), self.generate_data_key
+                )
+                self.data_key = (data_key, wrapped, time.monotonic() + self.data_key_lifetime)
+                # contents sealed by it are still opened after it is rotated
+                kms_cache = self._get_kms_cache()
+                if kms_cache is not None:
+                    kms_cache.put(
+                        hashlib.sha256(wrapped.encode("utf8")).digest(),
+                        base64.b64encode(data_key).decode()
+                    )
+        return self.data_key[:2]
+
+    async def _unwrap(self, wrapped):
+        """Decrypt a wrapped data key by KMS, once for concurrent envelopes
+        sealed by the same key.
+        """
+        if self.data_key is not None and self.data_key[1] == wrapped:
+            return self.data_key[0]
+        flight = self.data_key_flights.get(wrapped)
+        if flight is None:
+            flight = self.data_key_flights[wrapped] = asyncio.ensure_future(self._decrypt(wrapped))
+            flight.add_done_callback(lambda f: self.data_key_flights.pop(wrapped, None))
+        return base64.b64decode(await asyncio.shield(flight))
+
+    async def _encrypt(self, plain_txt):
+        """`encrypt` in KMS threads, the plaintext is cached for `_decrypt`.
+
+        With `kms_envelope_enabled` the content is sealed locally by the data
+        key instead.
+        """
+        if self.kms_envelope_enabled:
+            data_key, wrapped = await self._get_data_key()
+            cipher_blob = envelope.seal(data_key, wrapped, plain_txt)
+        else:
+            cipher_blob = await asyncio.get_event_loop().run_in_executor(
+                self._get_kms_executor(), self.encrypt, plain_txt
+            )
+        kms_cache = self._get_kms_cache()
+        if kms_cache is not None:
+            kms_cache.put(hashlib.sha256(cipher_blob.encode("utf8")).digest(), plain_txt)
+        return cipher_blob
+
+    async def _decrypt(self, cipher_blob):
+        """`decrypt` in KMS threads, plaintexts are cached by digest of
+        ciphertext so a ciphertext is decrypted once.
+        """
+        kms_cache = self._get_kms_cache()
+        digest = hashlib.sha256(cipher_blob.encode("utf8")).digest()
+        if kms_cache is not None:
+            plain_txt = kms_cache.get(digest, _MISSING)
+            if plain_txt is not _MISSING:
+                return plain_txt
+        wrapped = envelope.wrapped_key(cipher_blob)
+        if wrapped is not None:
+            plain_txt = self._unseal(await self._unwrap(wrapped), cipher_blob)
+        else:
+            plain_txt = await asyncio.get_event_loop().run_in_executor(
+                self._get_kms_executor(), self.decrypt, cipher_blob
+            )
+        if kms_cache is not None:
+            kms_cache.put(digest, plain_txt)
+        return plain_txt
+
+    async def _plain_content(self, data_id, content):
+        """Decrypt `content` if `data_id` is encrypted and KMS is enabled."""
+        if content and is_encrypted(data_id) and self.kms_enabled:
+            return await self._decrypt(content)
+        return content
+
+    async def _decrypt_many(self, values, errors):
+        """Decrypt values of encrypted items in place, concurrently and once
+        per ciphertext. Items failed to decrypt are moved to `errors`.
+
+        :param values: dict of value by (data_id, group).
+        :param errors: dict of exception by (data_id, group).
+        """
+        keys_by_blob = dict()
+        for key, content in values.items():
+            if content and is_encrypted(key[0]) and self.kms_enabled:
+                keys_by_blob.setdefault(content, []).append(key)
+        if not keys_by_blob:
+            return
+        results = await asyncio.gather(
+            *[self._decrypt(blob) for blob in keys_by_blob],
+            return_exceptions=True
+        )
+        for keys, result in zip(keys_by_blob.values(), results):
+            for key in keys:
+                if isinstance(result, Exception):
+                    del values[key]
+                    errors[key] = result
+                else:
+                    values[key] = result
+
+    async def _read_file(self, base, key):
+        return await read_file_async(base, key, self._get_file_executor())
+
+    async def _save_file(self, base, key, content):
+        return await save_file_async(base, key, content,
+                                     self._get_file_executor())
+
+    async def _delete_file(self, base, key):
+        return await delete_file_async(base, key, self._get_file_executor())
+
+    def stats(self):
+        """Get counters of the client.
+
+        * cache: size, hits, misses and evictions of the config cache.
+        * hedge: requests, hedged requests and hedged requests answered
+          first of hedged reads.
+        * get: number of gets made past the memory cache, number of gets
+          joining one of the same item in flight instead, and number of
+          stale values got and refreshed in background.
+        """
+        return {
+            "cache": self.config_cache.stats() if self.config_cache else None,
+            "get": {
+                "flights": self.get_flight_count,
+                "coalesced": self.get_coalesced_count,
+                "stale": self.get_stale_count,
+            },
+            "hedge": self.hedger.stats() if self.hedger else None,
+        }
+
+    async def close(self):
+        """Stop pullers and background tasks, close the pooled session and
+        executors.
+        """
+        for future in list(self.background_futures):
+            future.cancel()
+        if self.cai_enabled:
+            # initialized again on next use, with a new refreshing task
+            self.server_list = None
+        self.server_refresh_running = False
+        # pulling is initialized again by the next watcher added
+        if self.puller_pool is not None:
+            self.puller_pool.stop()
+            self.puller_pool = None
+        self.notify_queue = None
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+        if self.file_executor is not None:
+            self.file_executor.shutdown(wait=False)
+            self.file_executor = None
+        if self.kms_executor is not None:
+            self.kms_executor.shutdown(wait=False)
+            self.kms_executor = None
+        if self.callback_dispatcher is not None:
+            self.callback_dispatcher.shutdown()
+            self.callback_dispatcher = None
+        self.warm_values.clear()
+        self.warm_deadlines.clear()
+
     async def _refresh_server_list(self):
         logger = logging.getLogger('aioacm.refresh-server')
         async with self.server_list_lock:
@@ -241,7 +729,8 @@ class ACMClient:
                 server_list = await get_server_list(
                     self.endpoint,
                     443 if self.tls_enabled else 8080,
-                    self.cai_enabled
+                    self.cai_enabled,
+                    self._get_session()
                 )
                 logger.debug(
                     "server_num:%s server_list:%s",
@@ -258,6 +747,8 @@ class ACMClient:
                 async with self.server_list_lock:
                     self.server_list = server_list
                     self.server_offset = 0
+                    if self.server_selector is not None:
+                        self.server_selector.retain(server_list)
                     if self.current_server not in server_list:
                         logger.warning(
                             "%s is not effective, change one",
@@ -278,13 +769,17 @@ class ACMClient:
         logger = logging.getLogger('aioacm.get-server')
         if self.server_list is None:
             async with self.server_list_lock:
+                # concurrent requests wait for the one initializing
+                if self.server_list is not None:
+                    return self.current_server
                 logger.info(
                     "server list is null, try to initialize"
                 )
                 server_list = await get_server_list(
                     self.endpoint,
                     443 if self.tls_enabled else 8080,
-                    self.cai_enabled
+                    self.cai_enabled,
+                    self._get_session()
                 )
                 if not server_list:
                     logger.error(
@@ -301,12 +796,7 @@ class ACMClient:
                 )
 
             if self.cai_enabled:
-                future = asyncio.ensure_future(
-                        self._refresh_server_list()
-                    )
-                future.add_done_callback(partial(self.log_and_rerun_on_failure, self._refresh_server_list))
-                # close job than run in backgroud.
-                _FUTURES.append(future)
+                self._run_in_background(self._refresh_server_list)
 
         logger.info("use server:%s" % str(self.current_server))
         return self.current_server
@@ -320,6 +810,7 @@ class ACMClient:
         :return: True if success or an exception will be raised.
         """
         logger = logging.getLogger("aioacm.remove")
+        from aiohttp import ClientResponseError
         data_id, group = process_common_params(data_id, group)
         logger.info(
             "data_id:%s, group:%s, namespace:%s, timeout:%s" % (data_id, group, self.namespace, timeout))
@@ -336,16 +827,17 @@ class ACMClient:
                                            'POST', timeout or self.default_timeout)
             logger.info("success to remove group:%s, data_id:%s, server response:%s" % (
                 group, data_id, resp))
+            self._invalidate_cache(self._config_key(data_id, group))
             return True
         except ClientResponseError as e:
-            if e.code == HTTPStatus.FORBIDDEN:
+            if e.status == HTTPStatus.FORBIDDEN:
                 logger.error(
                     "no right for namespace:%s, group:%s, data_id:%s" % (self.namespace, group, data_id))
                 raise ACMException("Insufficient privilege.")
             else:
                 logger.error("error code [:%s] for namespace:%s, group:%s, data_id:%s" % (
-                    e.code, self.namespace, group, data_id))
-                raise ACMException("Request Error, code is %s" % e.code)
+                    e.status, self.namespace, group, data_id))
+                raise ACMException("Request Error, code is %s" % e.status)
         except Exception as e:
             logger.exception("exception %s occur" % str(e))
             raise
@@ -367,6 +859,7 @@ class ACMClient:
         :return: True if success or an exception will be raised.
         """
         logger = logging.getLogger('aioacm.publish')
+        from aiohttp import ClientResponseError
         if content is None:
             raise ACMException("Can not publish none content, use remove instead.")
 
@@ -375,7 +868,7 @@ class ACMClient:
             content = content.decode("utf8")
 
         if is_encrypted(data_id) and self.kms_enabled:
-            content = self.encrypt(content)
+            content = await self._encrypt(content)
 
         logger.info("data_id:%s, group:%s, namespace:%s, content:%s, timeout:%s" % (
             data_id, group, self.namespace, truncate(content), timeout))
@@ -392,30 +885,40 @@ class ACMClient:
                                            'POST', timeout or self.default_timeout)
             logger.info("success to publish content, group:%s, data_id:%s, server response:%s" % (
                 group, data_id, resp))
+            self._invalidate_cache(self._config_key(data_id, group))
             return True
         except ClientResponseError as e:
-            if e.code == HTTPStatus.FORBIDDEN:
+            if e.status == HTTPStatus.FORBIDDEN:
                 logger.error(
                     "no right for namespace:%s, group:%s, data_id:%s" % (self.namespace, group, data_id))
                 raise ACMException("Insufficient privilege.")
             else:
                 logger.error("error code [:%s] for namespace:%s, group:%s, data_id:%s" % (
-                    e.code, self.namespace, group, data_id))
-                raise ACMException("Request Error, code is %s" % e.code)
+                    e.status, self.namespace, group, data_id))
+                raise ACMException("Request Error, code is %s" % e.status)
         except Exception as e:
             logger.exception("exception %s occur" % str(e))
             raise
 
-    async def get(self, data_id, group, timeout=None, no_snapshot=False):
-        content = await self.get_raw(data_id, group, timeout, no_snapshot)
-        if content and is_encrypted(data_id) and self.kms_enabled:
-            return self.decrypt(content)
-        return content
+    async def get(self, data_id, group, timeout=None, no_snapshot=False,
+                  max_staleness=None):
+        content = await self.get_raw(data_id, group, timeout, no_snapshot,
+                                     max_staleness)
+        return await self._plain_content(data_id, content)
 
-    async def get_raw(self, data_id, group, timeout=None, no_snapshot=False):
+    async def get_raw(self, data_id, group, timeout=None, no_snapshot=False,
+                      max_staleness=None):
         """Get value of one config item.
 
         Query priority:
+        0.  Get from in-memory cache if cache is enabled, items are
+            refreshed by watchers and expired after `cache_ttl` seconds.
+
+            If `max_staleness` is set, stale values are got without waiting
+            for the server and refreshed in background: items expired at
+            most `max_staleness` seconds ago, then failover dir, then
+            snapshots written at most `max_staleness` seconds ago.
+
         1.  Get from local failover dir(default: "{cwd}/acm/data").
             Failover dir can be manually copied from snapshot
             dir(default: "{cwd}/acm/snapshot") in advance.
@@ -430,11 +933,15 @@ class ACMClient:
         :param group: group, use "DEFAULT_GROUP" if no group specified.
         :param timeout: timeout for requesting server in seconds.
         :param no_snapshot: do not save snapshot.
+        :param max_staleness: seconds a stale value can be got for, use
+                              option `max_staleness` by default.
         :return: value.
         """
         logger = logging.getLogger('aioacm.get-config')
 
         no_snapshot = self.no_snapshot if no_snapshot is None else no_snapshot
+        if max_staleness is None:
+            max_staleness = self.max_staleness
         data_id, group = process_common_params(data_id, group)
         logger.info(
             "data_id:%s, group:%s, namespace:%s, timeout:%s",
@@ -444,16 +951,108 @@ class ACMClient:
             timeout
         )
 
+        cache_key = self._config_key(data_id, group)
+        # get from memory
+        config_cache = self._get_cache()
+        if config_cache is not None:
+            if max_staleness is None:
+                content, expired = config_cache.get(cache_key, _MISSING), False
+            else:
+                content, expired = config_cache.get_stale(cache_key, max_staleness, _MISSING)
+            if content is not _MISSING:
+                logger.debug("get %s from memory cache", cache_key)
+                if expired:
+                    self._revalidate(data_id, group, cache_key, timeout, no_snapshot)
+                return content
+
+        if max_staleness is not None:
+            content = await self._get_stale(data_id, group, cache_key, timeout,
+                                            no_snapshot, max_staleness)
+            if content is not None:
+                return content
+
+        # a cancelled caller does not cancel the get of others
+        return await asyncio.shield(
+            self._get_flight(data_id, group, cache_key, timeout, no_snapshot)
+        )
+
+    async def _get_latest(self, data_id, group, timeout=None):
+        """Get like `get_raw`, but never a cached or stale value.
+
+        Watchers and warm start refresh items by it, a stale value would
+        carry the md5 they already have.
+        """
+        data_id, group = process_common_params(data_id, group)
+        cache_key = self._config_key(data_id, group)
+        return await asyncio.shield(
+            self._get_flight(data_id, group, cache_key, timeout, False)
+        )
+
+    async def _get_stale(self, data_id, group, cache_key, timeout, no_snapshot,
+                         max_staleness):
+        """Get from failover dir or a recent snapshot, None if there is none.
+
+        A snapshot older than half of `max_staleness` is refreshed in
+        background.
+        """
+        logger = logging.getLogger('aioacm.get-config')
+
+        content = await self._read_file(self.failover_base, cache_key)
+        if content is not None:
+            logger.debug("get %s from failover directory", cache_key)
+            return content
+        age = await file_age_async(self.snapshot_base, cache_key,
+                                   self._get_file_executor())
+        if age is None or age > max_staleness:
+            return None
+        content = await self._read_file(self.snapshot_base, cache_key)
+        if content is not None:
+            logger.debug("get %s from snapshot written %.1fs ago", cache_key, age)
+            if age > max_staleness / 2:
+                self._revalidate(data_id, group, cache_key, timeout, no_snapshot)
+        return content
+
+    def _revalidate(self, data_id, group, cache_key, timeout, no_snapshot):
+        """Refresh a stale value got, without waiting for it."""
+        self.get_stale_count += 1
+        flight = self._get_flight(data_id, group, cache_key, timeout, no_snapshot)
+        # errors are logged by the get, retrieve them so they are not
+        # reported again as never retrieved
+        flight.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+    def _get_flight(self, data_id, group, cache_key, timeout, no_snapshot):
+        """Get of the item in flight, a new one if there is none."""
+        flight_key = (cache_key, no_snapshot)
+        flight = self.get_flights.get(flight_key)
+        if flight is None:
+            self.get_flight_count += 1
+            flight = asyncio.ensure_future(
+                self._get_uncached(data_id, group, cache_key, timeout, no_snapshot)
+            )
+            self.get_flights[flight_key] = flight
+            flight.add_done_callback(lambda _: self.get_flights.pop(flight_key, None))
+        else:
+            self.get_coalesced_count += 1
+            logging.getLogger('aioacm.get-config').debug(
+                "join get of %s in flight", cache_key
+            )
+        return flight
+
+    async def _get_uncached(self, data_id, group, cache_key, timeout, no_snapshot):
+        """Steps 1 to 3 of `get_raw`."""
+        logger = logging.getLogger('aioacm.get-config')
+        from aiohttp import ClientResponseError
+
         params = {
             "dataId": data_id,
             "group": group,
         }
         if self.namespace:
             params["tenant"] = self.namespace
+        config_cache = self._get_cache()
 
-        cache_key = group_key(data_id, group, self.namespace)
         # get from failover
-        content = read_file(self.failover_base, cache_key)
+        content = await self._read_file(self.failover_base, cache_key)
         if content is None:
             logger.debug(
                 "failover config is not exist for %s, "
@@ -469,8 +1068,9 @@ class ACMClient:
             return content
 
         # get from server
+        request = self._do_hedged_req if self.hedge_enabled else self._do_sync_req
         try:
-            content = await self._do_sync_req(
+            content = await request(
                 "/diamond-server/config.co",
                 None,
                 params,
@@ -479,7 +1079,7 @@ class ACMClient:
                 timeout or self.default_timeout
             )
         except ClientResponseError as e:
-            if e.code == HTTPStatus.NOT_FOUND:
+            if e.status == HTTPStatus.NOT_FOUND:
                 logger.warning(
                     "config not found for data_id:%s, group:%s, "
                     "namespace:%s, try to delete snapshot",
@@ -487,9 +1087,10 @@ class ACMClient:
                     group,
                     self.namespace
                 )
-                delete_file(self.snapshot_base, cache_key)
+                await self._delete_file(self.snapshot_base, cache_key)
+                self._invalidate_cache(cache_key)
                 return None
-            elif e.code == HTTPStatus.CONFLICT:
+            elif e.status == HTTPStatus.CONFLICT:
                 logger.error(
                     "config being modified concurrently for "
                     "data_id:%s, group:%s, namespace:%s",
@@ -497,7 +1098,7 @@ class ACMClient:
                     group,
                     self.namespace
                 )
-            elif e.code == HTTPStatus.FORBIDDEN:
+            elif e.status == HTTPStatus.FORBIDDEN:
                 logger.error(
                     "no right for data_id:%s, group:%s, "
                     "namespace:%s",
@@ -510,7 +1111,7 @@ class ACMClient:
                 logger.error(
                     "error code [:%s] for data_id:%s, group:%s, "
                     "namespace:%s",
-                    e.code,
+                    e.status,
                     data_id,
                     group,
                     self.namespace
@@ -524,6 +1125,9 @@ class ACMClient:
             if no_snapshot:
                 raise
 
+        if content is not None and config_cache is not None:
+            config_cache.put(cache_key, content)
+
         if no_snapshot:
             return content
 
@@ -537,7 +1141,7 @@ class ACMClient:
                 self.namespace
             )
             try:
-                save_file(self.snapshot_base, cache_key, content)
+                await self._save_file(self.snapshot_base, cache_key, content)
             except Exception as e:
                 logger.exception(
                     "save snapshot failed for %s, data_id:%s, "
@@ -556,7 +1160,7 @@ class ACMClient:
             group,
             self.namespace
         )
-        content = read_file(self.snapshot_base, cache_key)
+        content = await self._read_file(self.snapshot_base, cache_key)
         if content is None:
             logger.warning(
                 "snapshot is not exist for %s.",
@@ -570,6 +1174,157 @@ class ACMClient:
             )
             return content
 
+    async def get_many(self, keys, concurrency=None, timeout=None,
+                       no_snapshot=None):
+        """Get values of many config items concurrently.
+
+        Every item is got by `get_raw`, so failover dir and snapshot are
+        applied per item, and one failed item does not fail the others.
+        Encrypted items are then decrypted together, once per ciphertext.
+
+        :param keys: list of (data_id, group).
+        :param concurrency: max number of items got at the same time,
+                            use option `get_many_concurrency` by default.
+        :param timeout: timeout for requesting server in seconds.
+        :param no_snapshot: do not save snapshot, use option `no_snapshot`
+                            by default.
+        :return: (values, errors), values maps (data_id, group) to value,
+                 errors maps (data_id, group) to the exception raised.
+        """
+        logger = logging.getLogger("aioacm.get-many")
+        semaphore = asyncio.Semaphore(
+            concurrency or self.get_many_concurrency
+        )
+        values = dict()
+        errors = dict()
+
+        async def fetch(key):
+            async with semaphore:
+                try:
+                    values[key] = await self.get_raw(key[0], key[1], timeout,
+                                                     no_snapshot)
+                except Exception as e:
+                    errors[key] = e
+
+        start = time.time()
+        await asyncio.gather(*[fetch(key) for key in dict.fromkeys(keys)])
+        await self._decrypt_many(values, errors)
+        logger.info(
+            "%s items got, %s failed in %.3fs, namespace:%s",
+            len(values),
+            len(errors),
+            time.time() - start,
+            self.namespace
+        )
+        return values, errors
+
+    async def warm_start(self, keys, concurrency=None, timeout=None):
+        """Get config items needed at startup from local files, and refresh
+        them from server in background.
+
+        Values are got from failover dir or snapshot at once, with no server
+        request. All items are then got from server concurrently. Values got
+        are kept for watchers added to these items later, such watchers are
+        notified at once and long polling of the items hangs up from the
+        start, instead of checking them first. Values not taken by a watcher
+        are dropped `warm_values_ttl` seconds after the refresh is done.
+
+        :param keys: list of (data_id, group).
+        :param concurrency: max number of items refreshed at the same time,
+                            use option `get_many_concurrency` by default.
+        :param timeout: timeout for requesting server in seconds.
+        :return: (values, refreshing), values maps (data_id, group) to local
+                 value, None if there is none, refreshing is a future of
+                 (values, errors) like `get_many`, done once all items are
+                 refreshed.
+        """
+        logger = logging.getLogger("aioacm.warm-start")
+        keys = list(dict.fromkeys(keys))
+        values = dict()
+
+        async def load(key):
+            data_id, group = process_common_params(*key)
+            cache_key = self._config_key(data_id, group)
+            content = await self._read_file(self.failover_base, cache_key)
+            if content is None:
+                content = await self._read_file(self.snapshot_base, cache_key)
+            self.warm_values[cache_key] = content
+            self.warm_deadlines.pop(cache_key, None)
+            values[key] = content
+
+        start = time.time()
+        await asyncio.gather(*[load(key) for key in keys])
+        errors = dict()
+        await self._decrypt_many(values, errors)
+        for key, e in errors.items():
+            logger.error("failed to decrypt local value of %s: %s", key, e)
+            values[key] = None
+        logger.info(
+            "%s items got from local files in %.3fs, %s missing, namespace:%s",
+            len(values),
+            time.time() - start,
+            sum(1 for v in values.values() if v is None),
+            self.namespace
+        )
+        refreshing = asyncio.ensure_future(
+            self._warm_refresh(keys, concurrency, timeout)
+        )
+        return values, refreshing
+
+    async def _warm_refresh(self, keys, concurrency, timeout):
+        semaphore = asyncio.Semaphore(
+            concurrency or self.get_many_concurrency
+        )
+        values = dict()
+        errors = dict()
+
+        async def fetch(key):
+            async with semaphore:
+                data_id, group = process_common_params(*key)
+                cache_key = self._config_key(data_id, group)
+                cache_keys.append(cache_key)
+                try:
+                    content = await self._get_latest(data_id, group, timeout)
+                except Exception as e:
+                    errors[key] = e
+                    return
+            # watchers may have taken the local value already
+            if cache_key in self.warm_values:
+                self.warm_values[cache_key] = content
+            values[key] = content
+
+        cache_keys = list()
+        try:
+            await asyncio.gather(*[fetch(key) for key in keys])
+        finally:
+            self._expire_warm_values(cache_keys)
+        await self._decrypt_many(values, errors)
+        logging.getLogger("aioacm.warm-start").info(
+            "%s items refreshed, %s failed, namespace:%s",
+            len(values),
+            len(errors),
+            self.namespace
+        )
+        return values, errors
+
+    def _expire_warm_values(self, cache_keys):
+        """Drop values of `cache_keys` got by `warm_start` if no watcher
+        takes them within `warm_values_ttl` seconds.
+        """
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + self.warm_values_ttl
+        for cache_key in cache_keys:
+            if cache_key in self.warm_values:
+                self.warm_deadlines[cache_key] = deadline
+        loop.call_later(self.warm_values_ttl, self._drop_warm_values)
+
+    def _drop_warm_values(self):
+        now = asyncio.get_event_loop().time()
+        for cache_key, deadline in list(self.warm_deadlines.items()):
+            if deadline <= now:
+                del self.warm_deadlines[cache_key]
+                self.warm_values.pop(cache_key, None)
+
     async def list(self, page=1, size=200):
         """ Get config items of current namespace with content included.
 
@@ -580,6 +1335,7 @@ class ACMClient:
         :return:
         """
         logger = logging.getLogger("aioacom.list-config")
+        from aiohttp import ClientResponseError
         logger.info("try to list namespace:%s" % self.namespace)
 
         params = {
@@ -597,46 +1353,114 @@ class ACMClient:
                 d = d.decode("utf8")
             return json.loads(d)
         except ClientResponseError as e:
-            if e.code == HTTPStatus.FORBIDDEN:
+            if e.status == HTTPStatus.FORBIDDEN:
                 logger.error("no right for namespace:%s" % self.namespace)
                 raise ACMException("Insufficient privilege.")
             else:
-                logger.error("[list] error code [%s] for namespace:%s" % (e.code, self.namespace))
-                raise ACMException("Request Error, code is %s" % e.code)
+                logger.error("[list] error code [%s] for namespace:%s" % (e.status, self.namespace))
+                raise ACMException("Request Error, code is %s" % e.status)
         except Exception as e:
             logger.exception("exception %s occur" % str(e))
             raise
 
-    async def list_all(self, group=None, prefix=None):
+    async def list_all(self, group=None, prefix=None, concurrency=None, page_size=None):
         """ Get all config items of current namespace, with content included.
 
+        Pages after the first one are requested concurrently.
         Warning: If there are lots of config in namespace, this function may cost some time.
 
         :param group: only dataIds with group match shall be returned.
         :param prefix: only dataIds startswith prefix shall be returned **it's case sensitive**.
+        :param concurrency: max number of pages requested at the same time, use option `list_concurrency` by default.
+        :param page_size: items per page, use option `list_page_size` by default.
         :return:
         """
         logger = logging.getLogger("aioacm.list-all-config")
         logger.info("namespace:%s, group:%s, prefix:%s" % (self.namespace, group, prefix))
 
-        def matching(ori):
-            return (group is None or ori["group"] == group) and (prefix is None or ori["dataId"].startswith(prefix))
+        ret_list = list()
+        configs = self.iter_configs(group, prefix, False, concurrency, page_size)
+        async for i in configs:
+            ret_list.append(i)
+        logger.debug("%s items got from acm server" % configs.total_count)
+        logger.debug("%s items returned" % len(ret_list))
+        return ret_list
 
-        result = await self.list(1, 200)
-        if not result:
-            logger.warning("can not get config items of %s" % self.namespace)
-            return list()
+    async def get_all(self, group=None, prefix=None, verify_md5=False, concurrency=None, page_size=None):
+        """ Get all config items of current namespace with content, taking contents from list pages.
 
-        ret_list = [{"dataId": i["dataId"], "group": i["group"]} for i in result["pageItems"] if matching(i)]
-        pages = result["pagesAvailable"]
-        logger.debug("%s items got from acm server" % result["totalCount"])
+        Only items whose content is missing from the page, or does not match
+        its md5 if `verify_md5` is set, are got one by one by `get`.
+        Contents are put into the in-memory cache if cache is enabled.
 
-        for i in range(2, pages + 1):
-            result = await self.list(i, 200)
-            ret_list += [{"dataId": j["dataId"], "group": j["group"]} for j in result["pageItems"] if matching(j)]
+        :param group: only dataIds with group match shall be returned.
+        :param prefix: only dataIds startswith prefix shall be returned **it's case sensitive**.
+        :param verify_md5: whether to check content of list pages against md5.
+        :param concurrency: max number of pages or items requested at the same time,
+                            use option `list_concurrency` by default.
+        :param page_size: items per page, use option `list_page_size` by default.
+        :return: list of dicts with dataId, group and content.
+        """
+        logger = logging.getLogger("aioacm.get-all-config")
+        logger.info("namespace:%s, group:%s, prefix:%s" % (self.namespace, group, prefix))
+        semaphore = asyncio.Semaphore(concurrency or self.list_concurrency)
+
+        async def resolve(item):
+            async with semaphore:
+                item["content"] = await self.page_content(item, verify_md5)
+            item.pop("md5")
+
+        ret_list = list()
+        futures = list()
+        async for i in self.iter_configs(group, prefix, True, concurrency, page_size):
+            ret_list.append(i)
+            futures.append(resolve(i))
+        await asyncio.gather(*futures)
         logger.debug("%s items returned" % len(ret_list))
         return ret_list
 
+    async def page_content(self, item, verify_md5=False):
+        """ Get content of an item yielded by `iter_configs`.
+
+        Content in the list page is used, and put into the in-memory cache if
+        cache is enabled. If it is missing, or does not match md5 while
+        `verify_md5` is set, content is got by `get`.
+
+        :param item: dict with dataId, group, content and md5.
+        :param verify_md5: whether to check content of list page against md5.
+        :return: value.
+        """
+        logger = logging.getLogger("aioacm.page-content")
+        content = item.get("content")
+        md5 = item.get("md5")
+        if content is None or (verify_md5 and md5 and hashlib.md5(content.encode("GBK")).hexdigest() != md5):
+            logger.debug("content of %s:%s is incomplete in list page, get it by key" % (
+                item["group"], item["dataId"]))
+            return await self.get(item["dataId"], item["group"], no_snapshot=True)
+
+        config_cache = self._get_cache()
+        if config_cache is not None:
+            config_cache.put(self._config_key(item["dataId"], item["group"]), content)
+        return await self._plain_content(item["dataId"], content)
+
+    def iter_configs(self, group=None, prefix=None, with_content=True, read_ahead=None, page_size=None):
+        """ Iterate config items of current namespace page by page, use as `async for item in ...`,
+        within `async with` to stop requesting pages if the loop breaks early.
+
+        Pages are requested ahead of consuming, at most `read_ahead` pages are
+        in flight or buffered, so memory stays flat for large namespaces.
+
+        :param group: only dataIds with group match shall be returned.
+        :param prefix: only dataIds startswith prefix shall be returned **it's case sensitive**.
+        :param with_content: whether to include content and md5 as stored on server.
+        :param read_ahead: max number of pages requested ahead, use option `list_concurrency` by default.
+        :param page_size: items per page, use option `list_page_size` by default.
+        :return: ConfigIterator yields dicts with dataId, group and optionally content and md5.
+        """
+        return ConfigIterator(self, group, prefix, with_content,
+                              read_ahead or self.list_concurrency,
+                              page_size or self.list_page_size)
+
     @synchronized_with_attr("pulling_lock")
     def add_watcher(self, data_id, group, cb):
         self.add_watchers(data_id, group, [cb])
@@ -665,13 +1489,10 @@ class ACMClient:
             group,
             self.namespace
         )
-        cache_key = group_key(data_id, group, self.namespace)
-        wl = self.watcher_mapping.get(cache_key)
-        if not wl:
-            wl = list()
-            self.watcher_mapping[cache_key] = wl
+        cache_key = self._config_key(data_id, group)
+        self.config_keys[cache_key] = cache_key
         for cb in cb_list:
-            wl.append(WatcherWrap(cache_key, cb))
+            self.watcher_mapping.add(cache_key, cb)
             if hasattr(cb, '__name__'):
                 cb_name = cb.__name__
             elif hasattr(cb, 'func'):
@@ -683,70 +1504,57 @@ class ACMClient:
                 "new callback is:%s, callback number is:%s",
                 cache_key,
                 cb_name,
-                len(wl)
+                self.watcher_mapping.count(cache_key)
             )
 
-        if self.puller_mapping is None:
+        if self.puller_pool is None:
             logger.debug("pulling should be initialized")
             self._int_pulling()
 
         def callback():
-            if cache_key in self.puller_mapping:
-                logger.debug(
-                    "key:%s is already in pulling",
-                    cache_key
-                )
+            if self.puller_pool is None:
+                # closed in the meantime
                 return
-
-            for key, puller_info in self.puller_mapping.items():
-                if len(puller_info[1]) < self.pulling_config_size:
-                    logger.debug(
-                        "puller:%s is available, add key:%s",
-                        puller_info[0],
-                        cache_key
-                    )
-                    puller_info[1].append(cache_key)
-                    self.puller_mapping[cache_key] = puller_info
-                    break
-            else:
+            if cache_key in self.puller_pool:
                 logger.debug(
-                    "no puller available, "
-                    "new one and add key:%s",
+                    "key:%s is already in pulling",
                     cache_key
                 )
-                # NOTE: Is this `key_list` correct?
-                key_list = []
-                key_list.append(cache_key)
-                puller = asyncio.ensure_future(
-                    self._do_pulling(key_list, self.notify_queue)
-                )
-                self.puller_mapping[cache_key] = (puller, key_list)
-                puller.add_done_callback(
-                    partial(
-                        self.log_and_update_puller_on_failure,
-                        self._do_pulling,
-                        key_list, self.notify_queue,
-                        cache_key=cache_key
+                # pullers only notify changes, new watchers of a key in
+                # pulling are notified of its current value here.
+                cache_data = self.puller_pool.get(cache_key).cache_pool.get(cache_key)
+                if cache_data is None or cache_data.is_init:
+                    return
+                if cache_data.content is None and cache_data.md5 is not None:
+                    # content is dropped once delivered, get it again
+                    asyncio.ensure_future(self._notify_current(cache_data))
+                else:
+                    self.notify_queue.put_nowait(
+                        (cache_key, cache_data.content, cache_data.md5)
                     )
-                )
+                return
+            self.puller_pool.add(cache_key)
 
         asyncio.get_event_loop().call_soon(callback)
 
-    def log_and_update_puller_on_failure(self, coro, *args, **kwargs):
-        logger = logging.getLogger("aioacm.callback")
-        future = args[-1]
-        exc = future.exception()
-        if exc:
-            logger.error('Exception happened on future', exc_info=exc)
-            args = args[:-1]
-            cache_key = kwargs.pop('cache_key')
-            new_future = asyncio.ensure_future(coro(*args, **kwargs))
-            self.puller_mapping[cache_key] = (new_future, self.puller_mapping[cache_key][1])
-            new_future.add_done_callback(
-                partial(
-                    self.log_and_rerun_on_failure,
-                    coro, *args, **kwargs, cache_key=cache_key)
+    async def _notify_current(self, cache_data):
+        logger = logging.getLogger("aioacm.add-watcher")
+        cache_key = cache_data.key
+        try:
+            content = await self._get_latest(cache_key.data_id, cache_key.group)
+        except Exception as e:
+            logger.error(
+                "failed to get %s for new watchers: %s",
+                cache_key,
+                str(e)
             )
+            return
+        if content is not None:
+            md5 = hashlib.md5(content.encode("GBK")).hexdigest()
+        else:
+            md5 = None
+        if self.notify_queue is not None:
+            await self.notify_queue.put((cache_key, content, md5))
 
     @synchronized_with_attr("pulling_lock")
     def remove_watcher(self, data_id, group, cb, remove_all=False):
@@ -763,27 +1571,18 @@ class ACMClient:
         if not cb:
             raise ACMException("A callback function is needed.")
         data_id, group = process_common_params(data_id, group)
-        if not self.puller_mapping:
+        if self.puller_pool is None:
             logger.warning("[remove-watcher] watcher is never started.")
             return
-        cache_key = group_key(data_id, group, self.namespace)
-        wl = self.watcher_mapping.get(cache_key)
-        if not wl:
+        cache_key = self._config_key(data_id, group)
+        if cache_key not in self.watcher_mapping:
             logger.warning(
                 "[remove-watcher] there is no watcher on key:%s",
                 cache_key
             )
             return
 
-        wrap_to_remove = list()
-        for i in wl:
-            if i.callback == cb:
-                wrap_to_remove.append(i)
-                if not remove_all:
-                    break
-
-        for i in wrap_to_remove:
-            wl.remove(i)
+        self.watcher_mapping.remove(cache_key, cb, remove_all)
 
         if hasattr(cb, '__name__'):
             cb_name = cb.__name__
@@ -798,28 +1597,29 @@ class ACMClient:
             cache_key,
             remove_all
         )
-        if not wl:
+        if cache_key not in self.watcher_mapping:
             logger.debug(
                 "[remove-watcher] there is no watcher for:%s, "
                 "kick out from pulling",
                 cache_key
             )
-            self.watcher_mapping.pop(cache_key)
-            puller_info = self.puller_mapping[cache_key]
-            puller_info[1].remove(cache_key)
-            if not puller_info[1]:
-                logger.debug(
-                    "[remove-watcher] there is no pulling keys for puller:%s, "
-                    "stop it",
-                    puller_info[0]
-                )
-                self.puller_mapping.pop(cache_key)
-                puller_info[0].cancel()
+            self.config_keys.pop(cache_key, None)
+            self.puller_pool.remove(cache_key)
 
     async def _do_sync_req(self, url: str, headers: dict = None,
                            params: dict = None, data: str = None,
-                           method: str = 'get', timeout: int = None):
+                           method: str = 'get', timeout: int = None,
+                           interactive: bool = True, tried: set = None):
+        """Request servers until one of them answers.
+
+        Servers are picked by the server selector, latency of `interactive`
+        requests feeds it, long polling requests only report errors.
+
+        :param tried: servers not to request, servers requested are added to
+            it, share it to send concurrent requests to different servers.
+        """
         logger = logging.getLogger("aioacm.do-sync-req")
+        from aiohttp import ClientError, ClientResponseError
 
         # url = "?".join([url, urlencode(params)]) if params else url
         all_headers = self._get_common_headers(params, data)
@@ -833,13 +1633,27 @@ class ACMClient:
             data,
             timeout
         )
-        tries = 0
+        selector = self._get_selector()
+        loop = asyncio.get_event_loop()
+        tried = set() if tried is None else tried
         while True:
             try:
-                server_info = await self.get_server()
+                await self.get_server()
+                server_info = selector.select(
+                    self.server_list or [], self.current_server, tried
+                )
                 if not server_info:
+                    if self.server_list:
+                        logger.error(
+                            "all servers not tried are ejected, "
+                            "tried %s",
+                            len(tried)
+                        )
+                        raise ACMRequestException("All server are not available")
                     logger.error("can not get one server.")
                     raise ACMException("Server is not available.")
+                self.current_server = server_info
+                tried.add(server_info)
                 address, port, is_ip_address = server_info
                 server = ":".join([address, str(port)])
                 # if tls is enabled and server address is in ip,
@@ -850,37 +1664,41 @@ class ACMClient:
                     server,
                     url
                 )
-                async with ClientSession() as request:
-                    if method.upper() == 'POST':
-                        if data and not isinstance(data, bytes):
-                            data = urlencode(data, encoding='GBK').encode()
-                        request_ctx = request.post(
-                            server_url,
-                            headers=all_headers,
-                            params=params,
-                            data=data,
-                            timeout=timeout
-                        )
-                    else:
-                        request_ctx = request.get(
-                            server_url,
-                            headers=all_headers,
-                            params=params,
-                            timeout=timeout
-                        )
-                    async with request_ctx as resp:
-                        resp.raise_for_status()
-                        text = await resp.text()
+                request = self._get_session()
+                start = loop.time()
+                if method.upper() == 'POST':
+                    if data and not isinstance(data, bytes):
+                        data = urlencode(data, encoding='GBK').encode()
+                    request_ctx = request.post(
+                        server_url,
+                        headers=all_headers,
+                        params=params,
+                        data=data,
+                        timeout=timeout
+                    )
+                else:
+                    request_ctx = request.get(
+                        server_url,
+                        headers=all_headers,
+                        params=params,
+                        timeout=timeout
+                    )
+                async with request_ctx as resp:
+                    resp.raise_for_status()
+                    text = await resp.text()
 
-                        if resp.status > 300:
-                            raise HTTPError(server_url, resp.status,
-                                            resp.reason, all_headers, None)
+                    if resp.status > 300:
+                        raise HTTPError(server_url, resp.status,
+                                        resp.reason, all_headers, None)
 
-                    logger.debug(
-                        "info from server:%s",
-                        server
-                    )
-                    return text
+                selector.record(
+                    server_info, loop.time() - start if interactive else None
+                )
+                logger.debug(
+                    "info from server:%s",
+                    server
+                )
+                return text
             except HTTPError as e:
                 if e.code in [
                     HTTPStatus.INTERNAL_SERVER_ERROR,
@@ -893,70 +1711,138 @@ class ACMClient:
                         server,
                         e.msg
                     )
+                    selector.record(server_info, error=True)
                 else:
                     raise
             except asyncio.TimeoutError:
                 logger.warning("%s request timeout", server)
+                selector.record(server_info, error=True)
+            except ClientResponseError as exc:
+                # a server answering 4xx is alive, the request is wrong
+                if exc.status < 500:
+                    selector.record(server_info)
+                    raise
+                logger.warning(
+                    "%s request error. %s",
+                    server,
+                    exc
+                )
+                retry_after = None
+                if exc.status == HTTPStatus.SERVICE_UNAVAILABLE:
+                    retry_after = parse_retry_after(exc.headers)
+                if retry_after is not None:
+                    selector.trip(server_info, retry_after)
+                else:
+                    selector.record(server_info, error=True)
             except ClientError as exc:
                 logger.warning(
                     "%s request error. %s",
                     server,
                     exc
                 )
+                selector.record(server_info, error=True)
             except URLError as e:
                 logger.warning(
                     "%s connection error:%s",
                     server,
                     e.reason
                 )
+                selector.record(server_info, error=True)
 
-            tries += 1
-            if tries >= len(self.server_list):
+            if len(tried) >= len(self.server_list):
                 logger.error(
                     "%s maybe down, no server is currently "
                     "available",
                     server
                 )
                 raise ACMRequestException("All server are not available")
-            await self.change_server()
             logger.warning("%s maybe down, skip to next", server)
 
-    async def _do_pulling(self, cache_list: list, queue: asyncio.Queue):
+    async def _do_hedged_req(self, *args):
+        """Request like `_do_sync_req`, hedged by a request to another server.
+
+        If no answer is got within `hedge_percentile` of recent latencies,
+        the same request is sent to another server, the first answer wins and
+        the other request is cancelled. At most `hedge_budget` of requests
+        are hedged.
+        """
+        logger = logging.getLogger("aioacm.hedged-req")
+        hedger = self._get_hedger()
+        loop = asyncio.get_event_loop()
+        start = loop.time()
+        delay = hedger.delay()
+        tried = set()
+        primary = asyncio.ensure_future(self._do_sync_req(*args, tried=tried))
+        if delay is None:
+            text = await primary
+            hedger.observe(loop.time() - start)
+            return text
+        pending = set([primary])
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if not done and len(tried) < len(self.server_list or ()) \
+                    and hedger.acquire():
+                logger.debug("no answer in %.3fs, hedge the request", delay)
+                pending.add(asyncio.ensure_future(
+                    self._do_sync_req(*args, tried=tried)
+                ))
+            errors = []
+            while True:
+                for task in done:
+                    exc = task.exception()
+                    if exc is None:
+                        hedger.observe(loop.time() - start)
+                        if task is not primary:
+                            hedger.hedge_wins += 1
+                        return task.result()
+                    # an answer of a server like 404 is final, wait for the
+                    # other request if servers of this one failed
+                    if not isinstance(exc, ACMException):
+                        raise exc
+                    errors.append(exc)
+                if not pending:
+                    raise errors[0]
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _do_pulling(self, cache_list: list, queue: asyncio.Queue,
+                          cache_pool: dict):
+        """Long polling keys of `cache_list`.
+
+        Only keys just initialized, or whose md5 changed, are put to `queue`.
+        """
         logger = logging.getLogger("aioacm.do-pulling")
-        cache_pool = dict()
-        for cache_key in cache_list:
-            cache_pool[cache_key] = CacheData(cache_key, self)
+        for cache_key in list(cache_list):
+            if cache_key not in cache_pool:
+                cache_pool[cache_key] = await self._load_cache_data(cache_key, queue)
 
+        failures = 0
         while cache_list:
-            unused_keys = set(cache_pool.keys())
             contains_init_key = False
-            probe_update_string = ""
-            for cache_key in cache_list:
+            probe_lines = list()
+            # keys may be added or removed while loading cache data
+            for cache_key in list(cache_list):
                 cache_data = cache_pool.get(cache_key)
                 if not cache_data:
-                    logger.debug("new key added: %s" % cache_key)
-                    cache_data = CacheData(cache_key, self)
+                    logger.debug("new key added: %s", cache_key)
+                    cache_data = await self._load_cache_data(cache_key, queue)
                     cache_pool[cache_key] = cache_data
                 if cache_data.is_init:
                     contains_init_key = True
-                data_id, group, namespace = parse_key(cache_key)
-                probe_update_string += WORD_SEPARATOR.join([
-                    data_id,
-                    group,
-                    cache_data.md5 or "",
-                    self.namespace
-                ])
-                probe_update_string += LINE_SEPARATOR
-                try:
-                    unused_keys.remove(cache_key)
-                except KeyError:
-                    pass
-            for k in unused_keys:
-                logger.debug(
-                    "%s is no longer watched, remove from cache",
-                    k
-                )
-                cache_pool.pop(k)
+                probe_lines.append(cache_data.probe_line())
+            if len(cache_pool) > len(probe_lines):
+                watched = set(cache_list)
+                for k in [k for k in cache_pool if k not in watched]:
+                    logger.debug(
+                        "%s is no longer watched, remove from cache",
+                        k
+                    )
+                    cache_pool.pop(k)
+            probe_update_string = "".join(probe_lines)
 
             logger.debug(
                 "try to detected change from server probe "
@@ -971,7 +1857,8 @@ class ACMClient:
 
             data = {"Probe-Modify-Request": probe_update_string}
 
-            changed_keys = list()
+            changed_keys = set()
+            polled = False
             try:
                 resp = await self._do_sync_req(
                     "/diamond-server/config.co",
@@ -979,16 +1866,18 @@ class ACMClient:
                     None,
                     data,
                     'POST',
-                    self.pulling_timeout + 10
+                    self.pulling_timeout + 10,
+                    interactive=False
                 )
-                changed_keys = [
-                    group_key(*i)
+                changed_keys = set(
+                    ConfigKey._make(i[:3])
                     for i in parse_pulling_result(resp)
-                ]
+                )
                 logger.debug(
                     "following keys are changed from server %s",
                     truncate(str(changed_keys))
                 )
+                polled = True
             except ACMException as e:
                 logger.exception("acm exception: %s" % str(e))
             except Exception as e:
@@ -997,31 +1886,117 @@ class ACMClient:
                     str(e)
                 )
 
-            for cache_key, cache_data in cache_pool.items():
-                cache_data.is_init = False
-                if cache_key in changed_keys:
-                    data_id, group, namespace = parse_key(cache_key)
-                    content = await self.get(data_id, group)
-                    if content is not None:
-                        md5 = hashlib.md5(content.encode("GBK")).hexdigest()
-                    else:
-                        md5 = None
-                    cache_data.md5 = md5
-                    cache_data.content = content
-                await queue.put(
-                    (cache_key, cache_data.content, cache_data.md5)
+            semaphore = asyncio.Semaphore(self.pulling_refetch_concurrency)
+            refetching = list()
+            for cache_key in changed_keys:
+                cache_data = cache_pool.get(cache_key)
+                if cache_data is not None:
+                    refetching.append(
+                        self._refetch(cache_data, queue, semaphore)
+                    )
+            if contains_init_key:
+                for cache_key, cache_data in cache_pool.items():
+                    if cache_data.is_init and cache_key not in changed_keys:
+                        cache_data.is_init = False
+                        await queue.put(
+                            (cache_key, cache_data.content, cache_data.md5)
+                        )
+                        if not self.keep_watched_content:
+                            cache_data.content = None
+            # changed keys are got concurrently, and the next long polling
+            # starts once all of them are updated.
+            moved = await asyncio.gather(*refetching)
+            # keys reported changed again and again with none of them got
+            # are polled again with backoff, as a failed polling is
+            if polled and (not moved or any(moved)):
+                failures = 0
+            else:
+                failures += 1
+            if failures:
+                delay = self._pulling_backoff_delay(failures)
+                logger.warning(
+                    "long polling failed %s times in a row, retry in %.2fs",
+                    failures,
+                    delay
+                )
+                await asyncio.sleep(delay)
+
+    async def _load_cache_data(self, cache_key, queue):
+        """Cache data of a key starting long polling.
+
+        A key got by `warm_start` is notified at once from the value got,
+        other keys are loaded from local files and checked by the first long
+        polling without hanging up.
+        """
+        content = self.warm_values.pop(cache_key, _MISSING)
+        self.warm_deadlines.pop(cache_key, None)
+        if content is _MISSING:
+            return await CacheData.load(cache_key, self)
+        cache_data = CacheData(cache_key, content)
+        cache_data.is_init = False
+        await queue.put((cache_key, content, cache_data.md5))
+        if not self.keep_watched_content:
+            cache_data.content = None
+        return cache_data
+
+    def _pulling_backoff_delay(self, failures):
+        """Exponential backoff of the long polling loop, with half of it random.
+
+        Pullers of many clients failing at once do not retry in lock step.
+        """
+        delay = min(
+            self.pulling_max_backoff,
+            self.pulling_backoff * 2 ** min(failures - 1, 16)
+        )
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    async def _refetch(self, cache_data, queue, semaphore):
+        """Get a key reported changed and notify it if its md5 changed.
+
+        :return: whether md5 of the key moved, False if it failed to get.
+        """
+        logger = logging.getLogger("aioacm.do-pulling")
+        cache_key = cache_data.key
+        data_id, group, namespace = parse_key(cache_key)
+        async with semaphore:
+            self._invalidate_cache(cache_key)
+            try:
+                # md5 is of the content stored, encrypted or not
+                content = await self._get_latest(data_id, group)
+            except Exception as e:
+                logger.error(
+                    "failed to refetch %s: %s, retry in next polling",
+                    cache_key,
+                    str(e)
                 )
+                return False
+        if content is not None:
+            md5 = hashlib.md5(content.encode("GBK")).hexdigest()
+        else:
+            md5 = None
+        changed = cache_data.is_init or md5 != cache_data.md5
+        cache_data.is_init = False
+        cache_data.md5 = md5
+        cache_data.content = content if self.keep_watched_content else None
+        if changed:
+            await queue.put((cache_key, content, md5))
+        return changed
 
     @synchronized_with_attr("pulling_lock")
     def _int_pulling(self):
         logger = logging.getLogger("aioacm.init-pulling")
-        if self.puller_mapping is not None:
+        if self.puller_pool is not None:
             logger.info("puller is already initialized")
             return
-        self.puller_mapping = dict()
+        self.puller_pool = PullerPool(
+            self.pulling_config_size,
+            lambda puller: self._do_pulling(
+                puller.keys, self.notify_queue, puller.cache_pool
+            )
+        )
         self.notify_queue = asyncio.Queue()
-        future = asyncio.ensure_future(self._process_polling_result())
-        future.add_done_callback(partial(self.log_and_rerun_on_failure, self._process_polling_result))
+        self.callback_dispatcher = CallbackDispatcher(self.callback_thread_num)
+        self._run_in_background(self._process_polling_result)
         logger.info("init completed")
 
     async def _process_polling_result(self):
@@ -1047,33 +2022,46 @@ class ACMClient:
                 "namespace": namespace,
                 "content": content
             }
+            calls = list()
+            notified = list()
             for watcher in wl:
                 if not watcher.last_md5 == md5:
-                    cb = watcher.callback
-                    if hasattr(cb, '__name__'):
-                        cb_name = cb.__name__
-                    elif hasattr(cb, 'func'):
-                        cb_name = cb.func.__name__
-                    else:
-                        cb_name = str(cb)
                     logger.debug(
                         "md5 changed since last "
                         "call, calling %s",
-                        cb_name
+                        callback_name(watcher.callback)
                     )
-                    try:
-                        if iscoroutinefunction(watcher.callback):
-                            await watcher.callback(params)
-                        else:
-                            watcher.callback(params)
-                    except Exception as e:
-                        logger.exception(
-                            "exception %s occur "
-                            "while calling %s ",
-                            str(e),
-                            cb_name
-                        )
+                    calls.extend([(watcher.callback, params)] * watcher.count)
                     watcher.last_md5 = md5
+                    notified.append(watcher)
+            if not calls:
+                continue
+            # encrypted contents are decrypted in the dispatch of their key,
+            # so a KMS request does not hold back events of other keys
+            prepare = None
+            if content and is_encrypted(data_id) and self.kms_enabled:
+                prepare = self._decrypt_params(cache_key, params, notified, md5)
+            self.callback_dispatcher.dispatch(cache_key, calls, prepare)
+
+    async def _decrypt_params(self, cache_key, params, watchers, md5):
+        """Decrypt content of an event to dispatch.
+
+        :return: False if it failed, watchers are then not notified and will
+                 be notified by the next event of the same md5.
+        """
+        try:
+            params["content"] = await self._decrypt(params["content"])
+        except Exception as e:
+            logging.getLogger("aioacm.process-polling-result").error(
+                "failed to decrypt %s: %s, watchers are not notified",
+                cache_key,
+                str(e)
+            )
+            for watcher in watchers:
+                if watcher.last_md5 == md5:
+                    watcher.last_md5 = None
+            return False
+        return True
 
     def _get_common_headers(self, params, data):
         headers = {
@@ -1122,15 +2110,20 @@ class ACMClient:
     def _prepare_kms(self):
         if not (self.region_id and self.kms_ak and self.kms_secret):
             return False
+        if not load_kms_sdk():
+            return False
         if not self.kms_client:
-            self.kms_client = AcsClient(ak=self.kms_ak, secret=self.kms_secret, region_id=self.region_id)
+            acs_client = load_kms_sdk()[0]
+            self.kms_client = acs_client(ak=self.kms_ak, secret=self.kms_secret, region_id=self.region_id)
+        # the SDK requests KMS by urllib, with no certificate verification
+        import ssl
+        ssl._create_default_https_context = ssl._create_unverified_context
         return True
 
     def encrypt(self, plain_txt):
         if not self._prepare_kms():
             return plain_txt
-        ssl._create_default_https_context = ssl._create_unverified_context
-        req = EncryptRequest()
+        req = load_kms_sdk()[1]()
         req.set_KeyId(self.key_id)
         req.set_Plaintext(plain_txt if type(plain_txt) == bytes else plain_txt.encode("utf8"))
         resp = json.loads(self.kms_client.do_action_with_exception(req).decode("utf8"))
@@ -1139,20 +2132,53 @@ class ACMClient:
     def decrypt(self, cipher_blob):
         if not self._prepare_kms():
             return cipher_blob
-        ssl._create_default_https_context = ssl._create_unverified_context
-        req = DecryptRequest()
+        wrapped = envelope.wrapped_key(cipher_blob)
+        if wrapped is not None:
+            return self._unseal(base64.b64decode(self.decrypt(wrapped)), cipher_blob)
+        req = load_kms_sdk()[2]()
         req.set_CiphertextBlob(cipher_blob)
         resp = json.loads(self.kms_client.do_action_with_exception(req).decode("utf8"))
         return resp["Plaintext"]
 
+    def generate_data_key(self):
+        """Generate a data key for envelope encryption by KMS.
+
+        :return: (data key, data key wrapped by KMS).
+        """
+        if not self._prepare_kms():
+            raise ACMException("KMS is not available for envelope encryption")
+        req = load_kms_sdk()[3]()
+        req.set_KeyId(self.key_id)
+        req.set_NumberOfBytes(envelope.DATA_KEY_SIZE)
+        resp = json.loads(self.kms_client.do_action_with_exception(req).decode("utf8"))
+        return base64.b64decode(resp["Plaintext"]), resp["CiphertextBlob"]
+
+    @staticmethod
+    def _unseal(data_key, cipher_blob):
+        if not envelope.load_aesgcm():
+            raise ACMException("cryptography is needed to decrypt envelope content")
+        return envelope.unseal(data_key, cipher_blob)
+
+    def _run_in_background(self, coro):
+        """Run `coro` as a task rerun on failure, until `close` cancels it."""
+        future = asyncio.ensure_future(coro())
+        self.background_futures.add(future)
+        future.add_done_callback(self.background_futures.discard)
+        future.add_done_callback(partial(self.log_and_rerun_on_failure, coro))
+        return future
+
     def log_and_rerun_on_failure(self, coro, *args, **kwargs):
         logger = logging.getLogger('aioacm.callback')
         future = args[-1]
+        if future.cancelled():
+            return
         exc = future.exception()
         if exc:
             logger.error('Exception happened on future', exc_info=exc)
             args = args[:-1]
             new_future = asyncio.ensure_future(coro(*args, **kwargs))
+            self.background_futures.add(new_future)
+            new_future.add_done_callback(self.background_futures.discard)
             new_future.add_done_callback(
                 partial(
                     self.log_and_rerun_on_failure,
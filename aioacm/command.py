@@ -5,6 +5,7 @@ import sys
 import json
 import fcntl
 import shutil
+import hashlib
 import asyncio
 import gettext
 import zipfile
@@ -330,7 +331,7 @@ def _read_file(file):
         sys.exit(1)
 
 
-await def pull(args):
+async def pull(args):
     e, ep, n, ns = _process_namespace(args)
     c = _get_client(e, ep, n, ns)
     try:
@@ -448,17 +449,7 @@ def show(args):
 async def export(args):
     e, ep, n, ns = _process_namespace(args)
     c = _get_client(e, ep, n, ns)
-    try:
-        configs = await c.list_all()
-    except:
-        print("Get config list failed.")
-        sys.exit(1)
-
-    groups = set()
-    elements = set()
-    for i in configs:
-        groups.add(i["group"])
-        elements.add(os.path.join(i["group"], i["dataId"]) if i["group"] != DEFAULT_GROUP_NAME else i["dataId"])
+    concurrency = max(args.concurrency, 1)
     dest_file = args.file or "%s-%s.zip" % (e, n)
     zip_file = None
 
@@ -467,87 +458,136 @@ async def export(args):
             os.makedirs(args.dir)
         except OSError:
             pass
-        # process deleting
-        if args.delete:
-            candidates = list()
-            # get candidates
-            for root, dirs, files in os.walk(args.dir):
-                if not os.path.basename(root).startswith("."):
-                    for i in dirs:
-                        if i.startswith("."):
-                            continue
-
-                        if i not in groups:
-                            candidates.append(os.path.join(root, i))
-
-                    for i in files:
-                        if i.startswith("."):
-                            continue
-                        candidates.append(os.path.join(root, i))
-            # kick out elements
-            delete_list = list()
-            trunc_len = len(args.dir) + len(os.path.sep)
-            for i in candidates:
-                if i[trunc_len:] not in elements:
-                    delete_list.append(i)
-
-            # deleting
-            if delete_list:
-                print("Following files and dirs are not exist in ACM Server:\n")
-                for i in delete_list:
-                    print(" - " + i)
-
-                delete = True
-                if not args.force:
-                    while True:
-                        if sys.version_info[0] == 3:
-                            choice = input("\nDeleting all files above? (y/n)")
-                        else:
-                            choice = raw_input("\nDeleting all files above? (y/n)")
-                        if choice.lower() in ["y", "n"]:
-                            delete = choice.lower() == "y"
-                            break
-                        print("Invalid choice, please input y or n.")
-                if delete:
-                    for i in delete_list:
-                        try:
-                            if os.path.isfile(i):
-                                os.remove(i)
-                            else:
-                                shutil.rmtree(i)
-                        except OSError:
-                            pass
-                    print("Delete complete, continue to export...\n")
     else:
         zip_file = zipfile.ZipFile(dest_file, 'w', zipfile.ZIP_DEFLATED)
 
-    print(_colored(len(configs), "green") + " dataIds on ACM server will be exported to %s.\n" % _colored(
-        args.dir or dest_file, "yellow"))
+    # items are fetched by a bounded pool and written here as they arrive,
+    # at most `concurrency` items are in flight or waiting to be written.
+    configs = c.iter_configs(read_ahead=concurrency)
+    results = asyncio.Queue()
+    slots = asyncio.Semaphore(concurrency)
+
+    async def fetch(config):
+        try:
+            config["content"] = await c.page_content(config, verify_md5=True)
+        except Exception:
+            config["content"] = None
+        await results.put(config)
 
+    async def produce():
+        fetching = set()
+        try:
+            async for config in configs:
+                await slots.acquire()
+                future = asyncio.ensure_future(fetch(config))
+                fetching.add(future)
+                future.add_done_callback(fetching.discard)
+            if fetching:
+                await asyncio.wait(fetching)
+        finally:
+            for future in fetching:
+                future.cancel()
+            await results.put(None)
+
+    producer = asyncio.ensure_future(produce())
+    groups = set()
+    elements = set()
     i = 0
-    for config in configs:
-        rel_path = config["group"] if config["group"] != DEFAULT_GROUP_NAME else ""
-        if args.dir:
-            try:
-                os.makedirs(os.path.join(args.dir, rel_path))
-            except OSError:
-                pass
+    while True:
+        config = await results.get()
+        if config is None:
+            break
+        slots.release()
+        if i == 0:
+            print(_colored(configs.total_count, "green") + " dataIds on ACM server will be exported to %s.\n" %
+                  _colored(args.dir or dest_file, "yellow"))
         i += 1
-        sys.stdout.write("\033[K\rExporting: %s/%s   %s:%s" % (i, len(configs), config["group"], config["dataId"]))
+        sys.stdout.write("\033[K\rExporting: %s/%s   %s:%s" % (
+            i, configs.total_count, config["group"], config["dataId"]))
         sys.stdout.flush()
-        try:
-            content = await c.get(config["dataId"], config["group"], no_snapshot=True)
-        except:
+        content = config["content"]
+        if content is None:
             print("Get content of %s:%s failed." % (config["group"] or DEFAULT_GROUP_NAME, config["dataId"]))
+            producer.cancel()
+            configs.close()
             sys.exit(1)
 
+        rel_path = config["group"] if config["group"] != DEFAULT_GROUP_NAME else ""
         if args.dir:
+            groups.add(config["group"])
+            elements.add(os.path.join(rel_path, config["dataId"]))
+            try:
+                os.makedirs(os.path.join(args.dir, rel_path))
+            except OSError:
+                pass
             _write_file(os.path.join(args.dir, rel_path, config["dataId"]), content)
         else:
             zip_file.writestr(os.path.join(rel_path, config["dataId"]), content.encode("utf8"))
+
+    try:
+        await producer
+    except:
+        print("Get config list failed.")
+        sys.exit(1)
+    await c.close()
     if zip_file:
         zip_file.close()
+    if i == 0:
+        print(_colored(0, "green") + " dataIds on ACM server will be exported to %s.\n" % _colored(
+            args.dir or dest_file, "yellow"))
     print("")
+
+    # process deleting
+    if args.dir and args.delete:
+        candidates = list()
+        # get candidates
+        for root, dirs, files in os.walk(args.dir):
+            if not os.path.basename(root).startswith("."):
+                for i in dirs:
+                    if i.startswith("."):
+                        continue
+
+                    if i not in groups:
+                        candidates.append(os.path.join(root, i))
+
+                for i in files:
+                    if i.startswith("."):
+                        continue
+                    candidates.append(os.path.join(root, i))
+        # kick out elements
+        delete_list = list()
+        trunc_len = len(args.dir) + len(os.path.sep)
+        for i in candidates:
+            if i[trunc_len:] not in elements:
+                delete_list.append(i)
+
+        # deleting
+        if delete_list:
+            print("Following files and dirs are not exist in ACM Server:\n")
+            for i in delete_list:
+                print(" - " + i)
+
+            delete = True
+            if not args.force:
+                while True:
+                    if sys.version_info[0] == 3:
+                        choice = input("\nDeleting all files above? (y/n)")
+                    else:
+                        choice = raw_input("\nDeleting all files above? (y/n)")
+                    if choice.lower() in ["y", "n"]:
+                        delete = choice.lower() == "y"
+                        break
+                    print("Invalid choice, please input y or n.")
+            if delete:
+                for i in delete_list:
+                    try:
+                        if os.path.isfile(i):
+                            os.remove(i)
+                        else:
+                            shutil.rmtree(i)
+                    except OSError:
+                        pass
+                print("Delete complete.\n")
     print("All dataIds exported.\n")
 
 
@@ -587,63 +627,120 @@ async def import_to_server(args):
             else:
                 print("ignoring invalid path: %s" % info.filename)
 
-    # process deleting
-    if args.delete:
-        # pick up candidates
-        delete_list = list()
-        configs = await c.list_all()
-        for i in configs:
-            if (i["dataId"], i["group"]) not in data_to_import:
-                delete_list.append(i)
-
-        # deleting
-        if delete_list:
-            print("Following dataIds are not exist in %s:\n" % _colored(args.dir or src_file, "yellow"))
-            for i in delete_list:
-                print(" - %s:%s" % (i["group"], i["dataId"]))
-
-            delete = True
-            if not args.force:
-                while True:
-                    if sys.version_info[0] == 3:
-                        choice = input("\nDeleting all dataIds above in ACM server? (y/n)")
-                    else:
-                        choice = raw_input("\nDeleting all dataIds above in ACM server? (y/n)")
-                    if choice.lower() in ["y", "n"]:
-                        delete = choice.lower() == "y"
-                        break
-                    print("Invalid choice, please input y or n.")
-            if delete:
-                for i in delete_list:
-                    await c.remove(i["dataId"], i["group"])
-                print("Delete complete, continue to import...\n")
-
-    print(_colored(len(data_to_import), "green") + " files will be imported to ACM server.\n")
+    # compare with server, only new or changed items are published
+    concurrency = max(args.concurrency, 1)
+    server_md5 = dict()
+    try:
+        async for i in c.iter_configs(read_ahead=concurrency):
+            server_md5[(i["dataId"], i["group"])] = i["md5"] or (
+                _md5(i["content"]) if i["content"] is not None else None)
+    except:
+        print("Get config list failed.")
+        sys.exit(1)
 
-    i = 0
+    new_list = list()
+    changed_list = list()
     for data in data_to_import:
-        i += 1
-        sys.stdout.write("\033[K\rImporting: %s/%s   %s:%s" % (i, len(data_to_import), data[1], data[0]))
+        if data not in server_md5:
+            new_list.append(data)
+        elif _md5(_import_content(args, zip_file, data)) != server_md5[data]:
+            changed_list.append(data)
+    local = set(data_to_import)
+    delete_list = [i for i in server_md5 if i not in local] if args.delete else list()
+
+    if args.dry_run:
+        for i in new_list:
+            print(" + %s:%s" % (i[1], i[0]))
+        for i in changed_list:
+            print(" ~ %s:%s" % (i[1], i[0]))
+        for i in delete_list:
+            print(" - %s:%s" % (i[1], i[0]))
+        print("\n%s new, %s changed, %s unchanged, %s to delete.\n" % (
+            _colored(len(new_list), "green"), _colored(len(changed_list), "yellow"),
+            len(data_to_import) - len(new_list) - len(changed_list), _colored(len(delete_list), "red")))
+        if zip_file:
+            zip_file.close()
+        await c.close()
+        return
+
+    # process deleting
+    if delete_list:
+        print("Following dataIds are not exist in %s:\n" % _colored(args.dir or src_file, "yellow"))
+        for i in delete_list:
+            print(" - %s:%s" % (i[1], i[0]))
+
+        delete = True
+        if not args.force:
+            while True:
+                if sys.version_info[0] == 3:
+                    choice = input("\nDeleting all dataIds above in ACM server? (y/n)")
+                else:
+                    choice = raw_input("\nDeleting all dataIds above in ACM server? (y/n)")
+                if choice.lower() in ["y", "n"]:
+                    delete = choice.lower() == "y"
+                    break
+                print("Invalid choice, please input y or n.")
+        if delete:
+            failed = await _run_concurrently(lambda i: c.remove(i[0], i[1]), delete_list, concurrency)
+            for i in failed:
+                print("Delete %s/%s failed." % (i[1], i[0]))
+            print("Delete complete, continue to import...\n")
+
+    data_to_publish = new_list + changed_list
+    print(_colored(len(data_to_publish), "green") + " of %s files will be imported to ACM server, "
+                                                    "others are unchanged.\n" % len(data_to_import))
+
+    progress = [0]
+
+    async def publish(data):
+        await c.publish(data[0], data[1], _import_content(args, zip_file, data))
+        progress[0] += 1
+        sys.stdout.write("\033[K\rImporting: %s/%s   %s:%s" % (progress[0], len(data_to_publish), data[1], data[0]))
         sys.stdout.flush()
-        if args.dir:
-            f = os.path.join(args.dir, data[1], data[0]) if data[1] != DEFAULT_GROUP_NAME else os.path.join(args.dir,
-                                                                                                            data[0])
-            content = _read_file(f)
-        else:
-            name = os.path.join(data[1], data[0]) if data[1] != DEFAULT_GROUP_NAME else data[0]
-            content = zip_file.read(name)
 
-        try:
-            await c.publish(data[0], data[1], content)
-        except:
-            print("Publish %s/%s failed." % (data[1], data[0]))
-            sys.exit(1)
+    failed = await _run_concurrently(publish, data_to_publish, concurrency)
     if zip_file:
         zip_file.close()
+    await c.close()
     print("")
+    if failed:
+        for data in failed:
+            print("Publish %s/%s failed." % (data[1], data[0]))
+        sys.exit(1)
     print("All files imported.\n")
 
 
+def _md5(content):
+    if isinstance(content, bytes):
+        content = content.decode("utf8")
+    return hashlib.md5(content.encode("GBK")).hexdigest()
+
+
+def _import_content(args, zip_file, data):
+    if args.dir:
+        f = os.path.join(args.dir, data[1], data[0]) if data[1] != DEFAULT_GROUP_NAME else os.path.join(args.dir,
+                                                                                                        data[0])
+        return _read_file(f)
+    name = os.path.join(data[1], data[0]) if data[1] != DEFAULT_GROUP_NAME else data[0]
+    return zip_file.read(name)
+
+
+async def _run_concurrently(func, items, concurrency):
+    """Await func(item) for every item with at most `concurrency` running, return items failed."""
+    semaphore = asyncio.Semaphore(concurrency)
+    failed = list()
+
+    async def run(item):
+        async with semaphore:
+            try:
+                await func(item)
+            except Exception:
+                failed.append(item)
+
+    await asyncio.gather(*[run(i) for i in items])
+    return failed
+
+
 def _get_client(e, ep, n, ns):
     c = ACMClient(endpoint=e, namespace=(None if n == "[default]" else n), ak=ns["ak"], sk=ns["sk"])
     if ep.get("kms_enabled"):
@@ -736,6 +833,8 @@ def arg_parse():
                                     "delete the file not exist in ACM server (hidden files startswith . are igonred).")
     parser_export.add_argument("--force", action="store_true", default=False, help="[only for dir mode] "
                                                                                    "run and delete silently.")
+    parser_export.add_argument("--concurrency", dest="concurrency", type=int, default=16,
+                               help="max number of dataIds fetched at the same time, default is 16.")
     parser_export.set_defaults(func=export)
 
     # import
@@ -749,6 +848,10 @@ def arg_parse():
     parser_import.add_argument("--delete", action="store_true", default=False,
                                help="delete the dataId not exist locally.")
     parser_import.add_argument("--force", action="store_true", default=False, help="run and delete silently.")
+    parser_import.add_argument("--dry-run", dest="dry_run", action="store_true", default=False,
+                               help="only show dataIds to publish and delete.")
+    parser_import.add_argument("--concurrency", dest="concurrency", type=int, default=16,
+                               help="max number of dataIds published or deleted at the same time, default is 16.")
     parser_import.set_defaults(func=import_to_server)
 
     return parser.parse_args()
@@ -772,13 +875,17 @@ def main():
 
         acm push {dataId} [-f {file}]       # Push one file or content from stdin to ACM
 
-        acm export [-d {dir}] [-f {zip_file}] [--delete] [--force]  # Export dataIds as files.
+        acm export [-d {dir}] [-f {zip_file}] [--delete] [--force] [--concurrency {n}]  # Export dataIds as files.
             --delete:   If local file or directory can not match dataIds ACM, delete it.
             --force:    Overwrite or delete files without asking.
+            --concurrency:  Max number of dataIds fetched at the same time.
 
-        acm import [-d {dir}] [-f {zip_file}] [--delete] [--force]  # Import files to ACM.
+        acm import [-d {dir}] [-f {zip_file}] [--delete] [--force] [--dry-run] [--concurrency {n}]  # Import files to ACM.
             --delete:   If dataId or group can not match local files, delete it.
             --force:    Overwrite or delete dataIds without asking.
+            --dry-run:  Show dataIds to publish or delete without changing anything.
+            --concurrency:  Max number of dataIds published or deleted at the same time.
+            Only files changed or not existing in ACM are published.
 
     Examples:
         Configurations:
@@ -0,0 +1,81 @@
+# coding: utf8
+
+import asyncio
+import logging
+from asyncio import iscoroutinefunction
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("aioacm")
+
+
+def callback_name(cb):
+    if hasattr(cb, '__name__'):
+        return cb.__name__
+    elif hasattr(cb, 'func'):
+        return cb.func.__name__
+    return str(cb)
+
+
+class CallbackDispatcher:
+    """Invoke watcher callbacks off the long polling pipeline.
+
+    Sync callbacks run in a thread pool of `thread_num` threads, coroutine
+    functions run as tasks. Events of one key are delivered in order, events
+    of different keys are delivered concurrently.
+    """
+
+    def __init__(self, thread_num):
+        self.executor = ThreadPoolExecutor(max_workers=thread_num)
+        self.tails = dict()
+
+    def dispatch(self, key, calls, prepare=None):
+        """Invoke callbacks after the previous event of `key` is delivered.
+
+        :param key: key of the event.
+        :param calls: list of (callback, params), invoked concurrently.
+        :param prepare: coroutine awaited in order before the callbacks, such
+                        as one filling params, callbacks are skipped if it
+                        returns False.
+        :return: future done once all callbacks returned.
+        """
+        future = asyncio.ensure_future(
+            self._run(self.tails.get(key), calls, prepare)
+        )
+        self.tails[key] = future
+        future.add_done_callback(partial(self._done, key))
+        return future
+
+    def _done(self, key, future):
+        if self.tails.get(key) is future:
+            del self.tails[key]
+
+    async def _run(self, previous, calls, prepare=None):
+        if previous is not None:
+            await asyncio.wait([previous])
+        if prepare is not None and not await prepare:
+            return
+        await asyncio.gather(*[self._call(cb, params) for cb, params in calls])
+
+    async def _call(self, cb, params):
+        try:
+            if iscoroutinefunction(cb):
+                await cb(params)
+            else:
+                await asyncio.get_event_loop().run_in_executor(
+                    self.executor, cb, params
+                )
+        except Exception as e:
+            logger.exception(
+                "[callback-dispatcher] exception %s occur while calling %s",
+                str(e),
+                callback_name(cb)
+            )
+
+    async def join(self):
+        """Wait for events dispatched so far to be delivered."""
+        if self.tails:
+            await asyncio.wait(list(self.tails.values()))
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,53 @@
+# coding: utf8
+"""Envelope encryption of contents.
+
+Content is encrypted locally by AES-GCM with a data key, and the data key
+wrapped by KMS is stored along with it, as
+``envelope:<wrapped data key>:<base64 of nonce, ciphertext and tag>``.
+The last part is base64, so it never contains ``:``.
+"""
+
+import os
+import base64
+
+MARKER = "envelope:"
+SEPARATOR = ":"
+NONCE_SIZE = 12
+DATA_KEY_SIZE = 32
+
+
+def load_aesgcm():
+    """Import AES-GCM of `cryptography` on first use.
+
+    :return: AESGCM class, None if `cryptography` is not installed.
+    """
+    try:
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    except ImportError:
+        return None
+    return AESGCM
+
+
+def wrapped_key(content):
+    """Wrapped data key of an envelope, None if `content` is not one."""
+    if not content.startswith(MARKER):
+        return None
+    return content[len(MARKER):].rsplit(SEPARATOR, 1)[0]
+
+
+def seal(data_key, wrapped, plain_txt):
+    nonce = os.urandom(NONCE_SIZE)
+    if isinstance(plain_txt, str):
+        plain_txt = plain_txt.encode("utf8")
+    sealed = load_aesgcm()(data_key).encrypt(nonce, plain_txt, None)
+    return SEPARATOR.join([
+        MARKER + wrapped, base64.b64encode(nonce + sealed).decode()
+    ])
+
+
+def unseal(data_key, content):
+    sealed = base64.b64decode(content.rsplit(SEPARATOR, 1)[1])
+    plain_txt = load_aesgcm()(data_key).decrypt(
+        sealed[:NONCE_SIZE], sealed[NONCE_SIZE:], None
+    )
+    return plain_txt.decode("utf8")
@@ -1,5 +1,7 @@
 import sys
+import time
 import fcntl
+import asyncio
 import os.path
 import logging
 
@@ -61,3 +63,38 @@ def delete_file(base, key):
             "[delete-file] file not exists, file path:%s",
             file_path
         )
+
+
+async def read_file_async(base, key, executor=None):
+    """Run `read_file` in executor, so the event loop is not blocked by
+    slow disk or contended file lock.
+    """
+    return await asyncio.get_event_loop().run_in_executor(
+        executor, read_file, base, key
+    )
+
+
+async def save_file_async(base, key, content, executor=None):
+    return await asyncio.get_event_loop().run_in_executor(
+        executor, save_file, base, key, content
+    )
+
+
+def file_age(base, key):
+    """Seconds since the file was last written, None if it does not exist."""
+    try:
+        return time.time() - os.path.getmtime(os.path.join(base, key))
+    except OSError:
+        return None
+
+
+async def file_age_async(base, key, executor=None):
+    return await asyncio.get_event_loop().run_in_executor(
+        executor, file_age, base, key
+    )
+
+
+async def delete_file_async(base, key, executor=None):
+    return await asyncio.get_event_loop().run_in_executor(
+        executor, delete_file, base, key
+    )
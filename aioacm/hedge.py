@@ -0,0 +1,63 @@
+# coding: utf8
+
+import math
+from collections import deque
+
+
+class Hedger:
+    """When to send a hedged request, and how many of them.
+
+    A request not answered within the `percentile` of recent latencies is
+    hedged. Each request earns `budget` of a token and each hedged request
+    spends one, so at most about `budget` of requests are hedged, with bursts
+    of at most `burst` hedged requests. `percentile` is kept well above
+    ``1 - budget``, otherwise ordinary jitter spends the whole budget and
+    requests in the real tail are not hedged.
+
+    :param percentile: percentile of recent latencies to wait for, 0 to 1.
+    :param budget: max share of requests hedged.
+    :param window: number of recent latencies kept.
+    :param min_samples: latencies needed before hedging.
+    :param burst: max number of tokens saved.
+    """
+
+    def __init__(self, percentile=0.99, budget=0.05, window=200,
+                 min_samples=20, burst=5):
+        self.percentile = percentile
+        self.budget = budget
+        self.latencies = deque(maxlen=window)
+        self.min_samples = min_samples
+        self.burst = burst
+        self.tokens = 0.0
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def observe(self, latency):
+        self.latencies.append(latency)
+
+    def delay(self):
+        """Seconds to wait before hedging, None if latencies are too few."""
+        self.requests += 1
+        self.tokens = min(self.tokens + self.budget, self.burst)
+        if len(self.latencies) < self.min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(int(math.ceil(self.percentile * len(ordered))) - 1, len(ordered) - 1)
+        return ordered[max(index, 0)]
+
+    def acquire(self):
+        """Take a token to hedge a request, False if the budget is spent."""
+        # tokens are summed from fractions, allow for rounding
+        if self.tokens < 1 - 1e-9:
+            return False
+        self.tokens -= 1
+        self.hedged += 1
+        return True
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+        }
@@ -1,3 +1,5 @@
+from collections import namedtuple
+
 VALID_CHAR = set(['_', '-', '.', ':'])
 PARAM_KEYS = ["data_id", "group"]
 DEFAULT_GROUP_NAME = "DEFAULT_GROUP"
@@ -25,5 +27,22 @@ def group_key(data_id, group, namespace):
 
 
 def parse_key(key):
+    if isinstance(key, ConfigKey):
+        return key
     sp = key.split("+")
     return sp[0], sp[1], sp[2]
+
+
+class ConfigKey(namedtuple("ConfigKey", ["data_id", "group", "namespace"])):
+    """Key of a config item.
+
+    Hashing and comparison are those of the tuple, done in C from the
+    hashes cached by its strings. `str` gives the "+" joined form of
+    `group_key`, which is also the name of failover and snapshot files.
+    """
+    __slots__ = ()
+
+    def __str__(self):
+        return group_key(self.data_id, self.group, self.namespace)
+
+    __fspath__ = __str__
@@ -0,0 +1,124 @@
+# coding: utf8
+
+import asyncio
+import logging
+
+logger = logging.getLogger("aioacm")
+
+
+class Puller:
+    """A long polling task and the keys it polls.
+
+    `keys` is used as an ordered set, `cache_pool` maps keys to their
+    cache data and is carried along when a key moves to another puller.
+    """
+
+    def __init__(self):
+        self.keys = dict()
+        self.cache_pool = dict()
+        self.task = None
+
+
+class PullerPool:
+    """Pullers polling at most `capacity` keys each.
+
+    Keys are assigned to a puller with free slots in O(1). Once a puller
+    is less than half full, its keys are moved to the others if they have
+    room for all of them, and it is stopped.
+
+    :param capacity: max number of keys of one puller.
+    :param run: coroutine function polling keys of the puller given,
+                it is restarted if it fails.
+    """
+
+    def __init__(self, capacity, run):
+        self.capacity = capacity
+        self.run = run
+        self.mapping = dict()
+        self.pullers = dict()
+        self.available = dict()
+
+    def __contains__(self, key):
+        return key in self.mapping
+
+    def __len__(self):
+        return len(self.mapping)
+
+    def get(self, key):
+        return self.mapping.get(key)
+
+    def add(self, key):
+        puller = self.mapping.get(key)
+        if puller is not None:
+            return puller
+        puller = next(iter(self.available), None)
+        if puller is None:
+            puller = Puller()
+            self.pullers[puller] = None
+            self.available[puller] = None
+            self._start(puller)
+            logger.debug("[puller-pool] no puller available, new one for %s", key)
+        self._assign(key, puller)
+        return puller
+
+    def remove(self, key):
+        puller = self.mapping.pop(key, None)
+        if puller is None:
+            return
+        del puller.keys[key]
+        puller.cache_pool.pop(key, None)
+        if not puller.keys:
+            self._stop(puller)
+            return
+        self.available[puller] = None
+        if len(puller.keys) * 2 < self.capacity:
+            self._compact(puller)
+
+    def stop(self):
+        for puller in list(self.pullers):
+            self._stop(puller)
+        self.mapping.clear()
+
+    def _assign(self, key, puller, cache_data=None):
+        puller.keys[key] = None
+        if cache_data is not None:
+            puller.cache_pool[key] = cache_data
+        self.mapping[key] = puller
+        if len(puller.keys) >= self.capacity:
+            self.available.pop(puller, None)
+
+    def _compact(self, puller):
+        others = [p for p in self.available if p is not puller]
+        if len(puller.keys) > sum(self.capacity - len(p.keys) for p in others):
+            return
+        logger.debug(
+            "[puller-pool] move %s keys to other pullers",
+            len(puller.keys)
+        )
+        for key in list(puller.keys):
+            target = others[0]
+            self._assign(key, target, puller.cache_pool.get(key))
+            if len(target.keys) >= self.capacity:
+                others.pop(0)
+        puller.keys.clear()
+        self._stop(puller)
+
+    def _start(self, puller):
+        puller.task = asyncio.ensure_future(self.run(puller))
+        puller.task.add_done_callback(
+            lambda task: self._on_done(puller, task)
+        )
+
+    def _stop(self, puller):
+        self.pullers.pop(puller, None)
+        self.available.pop(puller, None)
+        if puller.task is not None:
+            puller.task.cancel()
+
+    def _on_done(self, puller, task):
+        if task.cancelled() or puller not in self.pullers:
+            return
+        exc = task.exception()
+        if exc:
+            logger.error('[puller-pool] puller failed, restart it', exc_info=exc)
+            self._start(puller)
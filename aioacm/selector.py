@@ -0,0 +1,150 @@
+# coding: utf8
+
+import time
+
+
+class ServerStats:
+    __slots__ = ("latency", "error_rate", "last_used", "failures",
+                 "cooldown", "open_until", "probing")
+
+    def __init__(self):
+        self.latency = None
+        self.error_rate = 0.0
+        self.last_used = time.monotonic()
+        self.failures = 0
+        self.cooldown = 0
+        self.open_until = None
+        self.probing = False
+
+
+class ServerSelector:
+    """Pick servers by EWMA of their latency and error rate.
+
+    A server's score is its average latency plus its error rate weighted by
+    `error_cost`, the lowest score wins. Servers never used score 0 so they
+    are tried first, and a server not picked for `explore_interval` seconds
+    is picked once to keep its score fresh.
+
+    Each server has a circuit breaker. After `breaker_threshold` failures in a
+    row the server is ejected for `breaker_cooldown` seconds, then one probe
+    request is let through. The server is admitted again if the probe
+    succeeds, otherwise it is ejected again for twice as long, up to
+    `breaker_max_cooldown` seconds.
+
+    :param alpha: weight of the latest sample in averages.
+    :param explore_interval: seconds before a server not picked is tried again.
+    :param error_cost: seconds a failed request counts for.
+    :param breaker_threshold: failures in a row to eject a server.
+    :param breaker_cooldown: seconds a server is first ejected for.
+    :param breaker_max_cooldown: max seconds a server is ejected for.
+    """
+
+    def __init__(self, alpha=0.3, explore_interval=10, error_cost=10,
+                 breaker_threshold=3, breaker_cooldown=1,
+                 breaker_max_cooldown=60):
+        self.alpha = alpha
+        self.explore_interval = explore_interval
+        self.error_cost = error_cost
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.breaker_max_cooldown = breaker_max_cooldown
+        self.stats = dict()
+
+    def _stats(self, server):
+        stats = self.stats.get(server)
+        if stats is None:
+            stats = self.stats[server] = ServerStats()
+        return stats
+
+    def score(self, server):
+        stats = self.stats.get(server)
+        if stats is None:
+            return 0.0
+        return (stats.latency or 0.0) + stats.error_rate * self.error_cost
+
+    def is_open(self, server, now=None):
+        """Whether `server` is ejected."""
+        stats = self.stats.get(server)
+        if stats is None or stats.open_until is None:
+            return False
+        return (now or time.monotonic()) < stats.open_until
+
+    def select(self, server_list, current=None, exclude=()):
+        """Best server of `server_list` not in `exclude`, `current` wins ties.
+
+        Ejected servers are skipped, a server whose cool-down is over is
+        picked first to probe it.
+
+        :return: server, or None if all of them are excluded or ejected.
+        """
+        now = time.monotonic()
+        candidates = [
+            s for s in server_list
+            if s not in exclude and not self.is_open(s, now)
+        ]
+        if not candidates:
+            return None
+        half_open = [
+            s for s in candidates
+            if s in self.stats and self.stats[s].open_until is not None
+        ]
+        if half_open:
+            # other requests skip the server until the probe is done, or
+            # for another cool-down if it never reports
+            server = half_open[0]
+            stats = self.stats[server]
+            stats.probing = True
+            stats.open_until = now + stats.cooldown
+        else:
+            server = min(candidates, key=lambda s: (self.score(s), s != current))
+            stale = [
+                s for s in candidates
+                if s != server and s in self.stats
+                and now - self.stats[s].last_used >= self.explore_interval
+            ]
+            if stale:
+                server = min(stale, key=lambda s: self.stats[s].last_used)
+        self._stats(server).last_used = now
+        return server
+
+    def record(self, server, latency=None, error=False):
+        """Record a request to `server`.
+
+        :param latency: seconds the request took, None to leave latency as is.
+        :param error: whether the request failed.
+        """
+        stats = self._stats(server)
+        if latency is not None:
+            if stats.latency is None:
+                stats.latency = latency
+            else:
+                stats.latency += self.alpha * (latency - stats.latency)
+        stats.error_rate += self.alpha * ((1.0 if error else 0.0) - stats.error_rate)
+        if not error:
+            stats.failures = 0
+            stats.cooldown = 0
+            stats.open_until = None
+            stats.probing = False
+            return
+        stats.failures += 1
+        if stats.probing:
+            self._open(stats, min(stats.cooldown * 2, self.breaker_max_cooldown))
+        elif stats.open_until is None and stats.failures >= self.breaker_threshold:
+            self._open(stats, self.breaker_cooldown)
+
+    def trip(self, server, seconds):
+        """Eject `server` for `seconds`, as asked by a 503 Retry-After."""
+        stats = self._stats(server)
+        stats.error_rate += self.alpha * (1.0 - stats.error_rate)
+        stats.failures += 1
+        self._open(stats, min(max(seconds, self.breaker_cooldown), self.breaker_max_cooldown))
+
+    def _open(self, stats, cooldown):
+        stats.cooldown = cooldown
+        stats.open_until = time.monotonic() + cooldown
+        stats.probing = False
+
+    def retain(self, server_list):
+        """Forget servers no longer in `server_list`."""
+        for server in [s for s in self.stats if s not in server_list]:
+            del self.stats[server]
@@ -5,7 +5,6 @@ import socket
 import logging
 
 from asyncio import TimeoutError
-from aiohttp import ClientSession, ClientError
 
 logger = logging.getLogger("aioacm")
 
@@ -22,9 +21,21 @@ def is_ipv4_address(address):
     return True
 
 
+async def _fetch_address(request, endpoint):
+    async with request.get(ADDRESS_URL_PTN % endpoint,
+                           timeout=ADDRESS_SERVER_TIMEOUT) as resp:
+        return await resp.text()
+
+
 async def get_server_list(endpoint: str, default_port: int = 8080,
-                          cai_enabled: bool = True) -> list:
-    logger = logger.getChild("get-server-list")
+                          cai_enabled: bool = True,
+                          session: "ClientSession" = None) -> list:
+    """Get server list from address server.
+
+    :param session: pooled session to reuse, a temporary one is opened
+                    and closed if not specified.
+    """
+    logger = logging.getLogger("aioacm.get-server-list")
     server_list = list()
     if not cai_enabled:
         logger.info(
@@ -36,11 +47,14 @@ async def get_server_list(endpoint: str, default_port: int = 8080,
     if ':' not in endpoint:
         content = ':'.join([endpoint, str(default_port)])
     else:
+        # imported on first use, aiohttp is slow to import
+        from aiohttp import ClientSession, ClientError
         try:
-            async with ClientSession() as request:
-                async with request.get(ADDRESS_URL_PTN % endpoint,
-                                       timeout=ADDRESS_SERVER_TIMEOUT) as resp:
-                    content = await resp.text()
+            if session is None:
+                async with ClientSession() as request:
+                    content = await _fetch_address(request, endpoint)
+            else:
+                content = await _fetch_address(session, endpoint)
             logger.debug("content from endpoint:%s", content)
         except ClientError as e:
             logger.error(
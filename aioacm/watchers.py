@@ -0,0 +1,89 @@
+# coding: utf8
+
+
+class WatcherWrap:
+    """A callback watching a key, `count` is the number of times it is added."""
+    __slots__ = ("callback", "last_md5", "watch_key", "count")
+
+    def __init__(self, key, callback):
+        self.callback = callback
+        self.last_md5 = None
+        self.watch_key = key
+        self.count = 1
+
+
+class WatcherMapping:
+    """Watchers of keys, indexed by callback.
+
+    A key watched by one callback, the common case, is mapped to its wrap
+    directly, a key watched by more callbacks is mapped to a dict of wraps
+    by callback. Adding and removing a callback are O(1).
+    """
+
+    def __init__(self):
+        self.mapping = dict()
+
+    def __contains__(self, key):
+        return key in self.mapping
+
+    def __len__(self):
+        return len(self.mapping)
+
+    def __iter__(self):
+        return iter(self.mapping)
+
+    def get(self, key):
+        """Wraps of callbacks watching `key`."""
+        entry = self.mapping.get(key)
+        if entry is None:
+            return ()
+        if isinstance(entry, WatcherWrap):
+            return (entry,)
+        return entry.values()
+
+    def count(self, key):
+        """Number of callbacks watching `key`, counting repeated ones."""
+        return sum(wrap.count for wrap in self.get(key))
+
+    def add(self, key, callback):
+        entry = self.mapping.get(key)
+        if entry is None:
+            self.mapping[key] = WatcherWrap(key, callback)
+            return
+        if isinstance(entry, WatcherWrap):
+            if entry.callback == callback:
+                entry.count += 1
+                return
+            entry = {entry.callback: entry}
+            self.mapping[key] = entry
+        wrap = entry.get(callback)
+        if wrap is None:
+            entry[callback] = WatcherWrap(key, callback)
+        else:
+            wrap.count += 1
+
+    def remove(self, key, callback, remove_all=False):
+        """Remove `callback` from `key`, once or all occurrences of it.
+
+        :return: number of occurrences removed.
+        """
+        entry = self.mapping.get(key)
+        if isinstance(entry, WatcherWrap):
+            wrap = entry if entry.callback == callback else None
+        elif entry is not None:
+            wrap = entry.get(callback)
+        else:
+            wrap = None
+        if wrap is None:
+            return 0
+        removed = wrap.count if remove_all else 1
+        wrap.count -= removed
+        if wrap.count:
+            return removed
+        if entry is wrap:
+            del self.mapping[key]
+            return removed
+        del entry[callback]
+        if len(entry) == 1:
+            self.mapping[key] = next(iter(entry.values()))
+        return removed
@@ -0,0 +1,38 @@
+# -*- coding: utf8 -*-
+
+import time
+
+from aioacm.cache import ConfigCache
+
+
+def test_lru_eviction():
+    c = ConfigCache(2)
+    c.put("a", "1")
+    c.put("b", "2")
+    assert c.get("a") == "1"
+    c.put("c", "3")
+    assert "b" not in c
+    assert c.get("b") is None
+    assert c.get("c") == "3"
+    assert c.stats() == {"size": 2, "hits": 2, "misses": 1, "evictions": 1}
+
+
+def test_ttl_expiration():
+    c = ConfigCache(10, ttl=0.05)
+    c.put("a", None)
+    assert c.get("a", "missing") is None
+    time.sleep(0.1)
+    assert c.get("a", "missing") == "missing"
+    assert c.stats()["evictions"] == 1
+
+
+def test_get_stale():
+    c = ConfigCache(10, ttl=0.05)
+    c.put("a", "1")
+    assert c.get_stale("a", 0.1) == ("1", False)
+    time.sleep(0.07)
+    assert c.get_stale("a", 0.1) == ("1", True)
+    time.sleep(0.1)
+    assert c.get_stale("a", 0.1, "missing") == ("missing", True)
+    assert "a" not in c
+    assert c.stats() == {"size": 0, "hits": 2, "misses": 1, "evictions": 1}
@@ -8,6 +8,7 @@ import pytest
 
 import aioacm
 from aioacm import files
+from aioacm.params import ConfigKey
 
 ENDPOINT = "acm.aliyun.com:8080"
 NAMESPACE = "81597****2b55bac3"
@@ -98,7 +99,7 @@ async def test_fake_watcher():
         content = None
         count = 0
 
-    cache_key = "+".join([data_id, group, ""])
+    cache_key = ConfigKey(data_id, group, "")
 
     def test_cb(args):
         print(args)
@@ -0,0 +1,87 @@
+# -*- coding: utf8 -*-
+
+import os
+import zipfile
+import argparse
+
+import pytest
+
+from aioacm import command
+
+from .stub import StubServer
+
+pytestmark = pytest.mark.asyncio
+
+
+def use_stub(monkeypatch, server):
+    ep = {"tls": False, "kms_enabled": False}
+    ns = {"ak": None, "sk": None}
+    monkeypatch.setattr(command, "_process_namespace",
+                        lambda args: (server.endpoint, ep, "[default]", ns))
+
+
+def export_args(**kwargs):
+    args = dict(namespace=None, file=None, dir=None, delete=False, force=True, concurrency=4)
+    args.update(kwargs)
+    return argparse.Namespace(**args)
+
+
+async def test_export_dir(tmp_path, monkeypatch):
+    async with StubServer() as server:
+        use_stub(monkeypatch, server)
+        for i in range(30):
+            server.set_config("app-%02d.properties" % i, "DEFAULT_GROUP" if i % 2 else "sandbox", "a=%s" % i)
+        server.set_config("big.properties", "sandbox", "b" * 100)
+        server.list_content_limit = 50
+        dest = tmp_path / "export"
+        os.makedirs(str(dest / "removed"))
+        await command.export(export_args(dir=str(dest), delete=True))
+        assert (dest / "app-01.properties").read_text() == "a=1"
+        assert (dest / "sandbox" / "app-00.properties").read_text() == "a=0"
+        assert (dest / "sandbox" / "big.properties").read_text() == "b" * 100
+        assert not (dest / "removed").exists()
+        assert server.hits["/diamond-server/config.co"] == 1
+
+
+async def test_export_zip(tmp_path, monkeypatch):
+    async with StubServer() as server:
+        use_stub(monkeypatch, server)
+        for i in range(30):
+            server.set_config("app-%02d.properties" % i, "sandbox", "a=%s" % i)
+        dest = str(tmp_path / "export.zip")
+        await command.export(export_args(file=dest, concurrency=1))
+        with zipfile.ZipFile(dest) as f:
+            assert sorted(f.namelist()) == sorted("sandbox/app-%02d.properties" % i for i in range(30))
+            assert f.read("sandbox/app-29.properties") == b"a=29"
+
+
+def import_args(**kwargs):
+    args = dict(namespace=None, file=None, dir=None, delete=False, force=True, dry_run=False, concurrency=4)
+    args.update(kwargs)
+    return argparse.Namespace(**args)
+
+
+async def test_import_diff(tmp_path, monkeypatch):
+    async with StubServer() as server:
+        use_stub(monkeypatch, server)
+        for i in range(10):
+            server.set_config("app-%s.properties" % i, "sandbox", "a=%s" % i)
+        server.set_config("removed.properties", "DEFAULT_GROUP", "r")
+        src = tmp_path / "src"
+        os.makedirs(str(src / "sandbox"))
+        for i in range(10):
+            (src / "sandbox" / ("app-%s.properties" % i)).write_text("a=%s" % (i if i else "changed"))
+        (src / "new.properties").write_text("n")
+
+        await command.import_to_server(import_args(dir=str(src), delete=True, dry_run=True))
+        assert "/diamond-server/datum.do" not in server.hits
+        assert "/diamond-server/basestone.do" in server.hits
+        assert server.configs[("app-0.properties", "sandbox", "")] == "a=0"
+
+        await command.import_to_server(import_args(dir=str(src), delete=True))
+        assert server.configs == dict(
+            [(("app-%s.properties" % i, "sandbox", ""), "a=%s" % i) for i in range(1, 10)] +
+            [(("app-0.properties", "sandbox", ""), "a=changed"), (("new.properties", "DEFAULT_GROUP", ""), "n")])
+        # one list page per run, and only new and changed items are published
+        assert server.hits["/diamond-server/basestone.do"] == 2 + 2
+        assert server.hits["/diamond-server/datum.do"] == 1
@@ -0,0 +1,65 @@
+# -*- coding: utf8 -*-
+
+import time
+import asyncio
+import threading
+
+import pytest
+
+from aioacm.dispatcher import CallbackDispatcher
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_order_per_key():
+    d = CallbackDispatcher(4)
+    delivered = list()
+
+    async def slow(params):
+        await asyncio.sleep(params["delay"])
+        delivered.append((params["key"], params["seq"]))
+
+    for seq, delay in enumerate((0.03, 0.02, 0.01)):
+        d.dispatch("a", [(slow, {"key": "a", "seq": seq, "delay": delay})])
+    d.dispatch("b", [(slow, {"key": "b", "seq": 0, "delay": 0})])
+    await d.join()
+    assert delivered == [("b", 0), ("a", 0), ("a", 1), ("a", 2)]
+    assert not d.tails
+    d.shutdown()
+
+
+async def test_sync_callback_in_thread_pool():
+    d = CallbackDispatcher(2)
+    threads = set()
+
+    def cb(params):
+        threads.add(threading.current_thread())
+        time.sleep(0.01)
+        if params["fail"]:
+            raise ValueError("callback failure is logged")
+
+    await d.dispatch("a", [(cb, {"fail": True}), (cb, {"fail": False})])
+    assert threading.current_thread() not in threads
+    assert len(threads) == 2
+    d.shutdown()
+
+
+async def test_prepare_in_order():
+    d = CallbackDispatcher(2)
+    delivered = list()
+
+    async def cb(params):
+        delivered.append(params["content"])
+
+    async def prepare(params, delay, ok=True):
+        await asyncio.sleep(delay)
+        params["content"] = params["content"].upper()
+        return ok
+
+    first, second, skipped = {"content": "a"}, {"content": "b"}, {"content": "c"}
+    d.dispatch("a", [(cb, first)], prepare(first, 0.02))
+    d.dispatch("a", [(cb, second)], prepare(second, 0))
+    d.dispatch("a", [(cb, skipped)], prepare(skipped, 0, ok=False))
+    await d.join()
+    assert delivered == ["A", "B"]
+    d.shutdown()
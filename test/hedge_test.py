@@ -0,0 +1,23 @@
+# -*- coding: utf8 -*-
+
+import pytest
+
+from aioacm.hedge import Hedger
+
+
+def test_delay_and_budget():
+    hedger = Hedger(percentile=0.9, budget=0.1, window=10, min_samples=5, burst=2)
+    assert hedger.delay() is None
+    for latency in range(1, 21):
+        hedger.observe(latency / 100.0)
+    # only the last 10 latencies are kept
+    assert hedger.delay() == pytest.approx(0.19)
+    assert not hedger.acquire()
+    for _ in range(100):
+        hedger.delay()
+    # tokens are capped by burst
+    assert [hedger.acquire() for _ in range(3)] == [True, True, False]
+    for _ in range(10):
+        hedger.delay()
+    assert hedger.acquire()
+    assert hedger.stats() == {"requests": 112, "hedged": 3, "hedge_wins": 0}
@@ -0,0 +1,532 @@
+# -*- coding: utf8 -*-
+
+import asyncio
+import threading
+
+import pytest
+
+import aioacm
+from aioacm import files
+
+from . import stub
+from .stub import StubServer
+from .kms_stub import FakeKMS
+
+pytestmark = pytest.mark.asyncio
+
+
+def make_client(server, tmp_path, namespace=None):
+    c = aioacm.ACMClient(server.endpoint, namespace)
+    c.set_options(failover_base=str(tmp_path / "data"),
+                  snapshot_base=str(tmp_path / "snapshot"))
+    return c
+
+
+async def test_pooled_session(tmp_path):
+    async with StubServer() as server:
+        server.set_config("app.properties", "sandbox", "a=1")
+        c = make_client(server, tmp_path)
+        for _ in range(20):
+            assert await c.get("app.properties", "sandbox") == "a=1"
+        session = c.session
+        await c.publish("app.properties", "sandbox", "a=2")
+        assert await c.get("app.properties", "sandbox") == "a=2"
+        assert c.session is session
+        # address server and configs are served by the same kept-alive connection
+        assert len(server.connections) == 1
+        refreshing = list(c.background_futures)
+        assert refreshing
+        await c.close()
+        assert c.session is None
+        # server list refreshing is stopped, it would open a new session
+        await asyncio.sleep(0)
+        assert all(f.cancelled() for f in refreshing)
+        assert not c.background_futures
+
+        # the client initializes again on next use
+        assert await c.get("app.properties", "sandbox") == "a=2"
+        assert c.background_futures
+        await c.close()
+
+
+async def test_watch_after_close(tmp_path):
+    async with StubServer() as server:
+        server.set_config("app.properties", "sandbox", "a=1")
+        c = make_client(server, tmp_path)
+        c.set_options(pulling_timeout=1)
+        received = list()
+        c.add_watcher("app.properties", "sandbox", lambda x: received.append(x["content"]))
+        await asyncio.sleep(0.3)
+        assert received == ["a=1"]
+        await c.close()
+        assert (c.puller_pool, c.notify_queue, c.callback_dispatcher) == (None, None, None)
+        assert not c.background_futures
+
+        # watchers added after closing are notified by new pullers
+        c.add_watcher("db.properties", "sandbox", lambda x: received.append(x["content"]))
+        server.set_config("db.properties", "sandbox", "b=1")
+        await asyncio.sleep(0.3)
+        assert received == ["a=1", "b=1"]
+        await c.close()
+
+
+async def test_server_failover(tmp_path):
+    async with StubServer() as server:
+        server.set_config("app.properties", "sandbox", "a=1")
+        c = make_client(server, tmp_path)
+        dead = ("127.0.0.1", 1, True)
+        alive = ("127.0.0.1", server.port, True)
+        c.server_list = [dead, alive]
+        c.current_server = dead
+        assert await c.get("app.properties", "sandbox") == "a=1"
+        assert c.current_server == alive
+        assert c.server_selector.score(dead) > c.server_selector.score(alive)
+        hits = server.hits["/diamond-server/config.co"]
+        for _ in range(10):
+            assert await c.get("app.properties", "sandbox") == "a=1"
+        assert server.hits["/diamond-server/config.co"] == hits + 10
+        await c.close()
+
+
+async def test_retry_after(tmp_path):
+    async with StubServer() as slow, StubServer() as busy:
+        for server in (slow, busy):
+            server.set_config("app.properties", "sandbox", "a=1")
+        slow.latency = 0.02
+        busy.retry_after = 60
+        c = make_client(busy, tmp_path)
+        c.server_list = [("127.0.0.1", busy.port, True), ("127.0.0.1", slow.port, True)]
+        c.current_server = c.server_list[0]
+        assert await c.get("app.properties", "sandbox") == "a=1"
+        assert c.server_selector.stats[c.server_list[0]].cooldown == 60
+        hits = busy.hits["/diamond-server/config.co"]
+        # the busy server is skipped although the other one is slower
+        busy.retry_after = None
+        for _ in range(5):
+            assert await c.get("app.properties", "sandbox") == "a=1"
+        assert busy.hits["/diamond-server/config.co"] == hits
+        # not found is an answer, no other server is tried
+        assert await c.get("missing.properties", "sandbox") is None
+        assert slow.hits["/diamond-server/config.co"] == 7
+        await c.close()
+
+
+async def test_hedged_read(tmp_path):
+    async with StubServer() as stalled, StubServer() as fast:
+        for server in (stalled, fast):
+            server.set_config("app.properties", "sandbox", "a=1")
+        c = make_client(fast, tmp_path)
+        c.set_options(hedge_enabled=True)
+        c.server_list = [("127.0.0.1", stalled.port, True), ("127.0.0.1", fast.port, True)]
+        c.current_server = c.server_list[0]
+        hedger = c._get_hedger()
+        for _ in range(hedger.min_samples):
+            hedger.observe(0.01)
+        hedger.tokens = 1
+        stalled.latency = 2
+        start = asyncio.get_event_loop().time()
+        assert await c.get("app.properties", "sandbox") == "a=1"
+        assert asyncio.get_event_loop().time() - start < 1
+        assert c.stats()["hedge"] == {"requests": 1, "hedged": 1, "hedge_wins": 1}
+        # no budget left, the request is not hedged
+        c.current_server = c.server_list[0]
+        c.server_selector.stats.clear()
+        stalled.latency = 0.1
+        assert await c.get("app.properties", "sandbox") == "a=1"
+        assert c.stats()["hedge"]["hedged"] == 1
+        # not found of the hedged request is final
+        hedger.tokens = 1
+        c.server_selector.stats.clear()
+        stalled.latency = 2
+        start = asyncio.get_event_loop().time()
+        assert await c.get("missing.properties", "sandbox") is None
+        assert asyncio.get_event_loop().time() - start < 1
+        await c.close()
+
+
+async def test_pulling_backoff(tmp_path):
+    c = aioacm.ACMClient("127.0.0.1:1")
+    c.set_options(pulling_backoff=0.02, pulling_max_backoff=0.08,
+                  failover_base=str(tmp_path / "data"), snapshot_base=str(tmp_path / "snapshot"))
+    assert [0.01 <= c._pulling_backoff_delay(1) <= 0.02,
+            0.04 <= c._pulling_backoff_delay(3) <= 0.08,
+            0.04 <= c._pulling_backoff_delay(100) <= 0.08] == [True, True, True]
+    calls = [0]
+
+    async def down(*args, **kwargs):
+        calls[0] += 1
+        raise aioacm.client.ACMRequestException("All server are not available")
+
+    c._do_sync_req = down
+    key = c._config_key("app.properties", "sandbox")
+    puller = asyncio.ensure_future(c._do_pulling({key: None}, asyncio.Queue(), dict()))
+    await asyncio.sleep(0.5)
+    puller.cancel()
+    # 0.01 + 0.02 + 0.04 and then 0.08 at most, 0.04 at least between tries
+    assert 5 <= calls[0] <= 14
+
+    # long polling works but the key reported changed can not be got
+    polls = [0]
+
+    async def get_down(url, headers=None, params=None, data=None, method="get", timeout=None, **kwargs):
+        if method == "POST":
+            polls[0] += 1
+            return "app.properties%ssandbox%s" % (aioacm.client.WORD_SEPARATOR, aioacm.client.LINE_SEPARATOR)
+        raise aioacm.client.ACMRequestException("All server are not available")
+
+    c._do_sync_req = get_down
+    puller = asyncio.ensure_future(c._do_pulling({key: None}, asyncio.Queue(), dict()))
+    await asyncio.sleep(0.5)
+    puller.cancel()
+    assert 5 <= polls[0] <= 14
+
+
+async def test_coalesced_get(tmp_path):
+    async with StubServer(latency=0.05) as server:
+        server.set_config("app.properties", "sandbox", "a=1")
+        c = make_client(server, tmp_path)
+        await c.get_server()
+        values = await asyncio.gather(*[c.get("app.properties", "sandbox") for _ in range(20)])
+        assert values == ["a=1"] * 20
+        assert server.hits["/diamond-server/config.co"] == 1
+        assert c.stats()["get"] == {"flights": 1, "coalesced": 19, "stale": 0}
+        assert not c.get_flights
+        # a cancelled caller leaves the others waiting
+        gets = [asyncio.ensure_future(c.get("app.properties", "sandbox")) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        gets[0].cancel()
+        assert await asyncio.gather(*gets[1:]) == ["a=1"] * 2
+        assert server.hits["/diamond-server/config.co"] == 2
+        await c.close()
+
+
+async def test_stale_while_revalidate(tmp_path):
+    async with StubServer() as server:
+        server.set_config("app.properties", "sandbox", "a=1")
+        c = make_client(server, tmp_path)
+        c.set_options(cache_enabled=True, cache_ttl=0.05, max_staleness=60)
+        assert await c.get("app.properties", "sandbox") == "a=1"
+        server.set_config("app.properties", "sandbox", "a=2")
+        server.latency = 0.2
+        await asyncio.sleep(0.1)
+        loop = asyncio.get_event_loop()
+        start = loop.time()
+        assert await c.get("app.properties", "sandbox") == "a=1"
+        assert loop.time() - start < 0.1
+        assert c.stats()["get"]["stale"] == 1
+        await asyncio.sleep(0.3)
+        assert await c.get("app.properties", "sandbox") == "a=2"
+
+        # a new client gets the snapshot if it is recent enough
+        fresh = make_client(server, tmp_path)
+        start = loop.time()
+        assert await fresh.get("app.properties", "sandbox", max_staleness=60) == "a=2"
+        assert loop.time() - start < 0.1
+        server.set_config("app.properties", "sandbox", "a=3")
+        await asyncio.sleep(0.05)
+        assert await fresh.get("app.properties", "sandbox", max_staleness=0.01) == "a=3"
+        await c.close()
+        await fresh.close()
+
+
+async def test_stale_watcher(tmp_path):
+    async with StubServer() as server:
+        server.set_config("app.properties", "sandbox", "a=1")
+        c = make_client(server, tmp_path)
+        c.set_options(max_staleness=60, pulling_timeout=1)
+        assert await c.get("app.properties", "sandbox") == "a=1"
+        received = list()
+        c.add_watcher("app.properties", "sandbox", lambda x: received.append(x["content"]))
+        await asyncio.sleep(0.3)
+        server.set_config("app.properties", "sandbox", "a=2")
+        await asyncio.sleep(0.5)
+        # changes are got from the server, not from the snapshot
+        assert received == ["a=1", "a=2"]
+        assert server.hits["/diamond-server/config.co"] < 10
+
+        # warm start refreshes from the server as well
+        server.set_config("db.properties", "sandbox", "b=1")
+        files.save_file(c.snapshot_base, str(c._config_key("db.properties", "sandbox")), "b=0")
+        values, refreshing = await c.warm_start([("db.properties", "sandbox")])
+        assert values == {("db.properties", "sandbox"): "b=0"}
+        assert await refreshing == ({("db.properties", "sandbox"): "b=1"}, {})
+        await c.close()
+
+
+async def test_cache(tmp_path):
+    async with StubServer() as server:
+        server.set_config("app.properties", "sandbox", "a=1")
+        c = make_client(server, tmp_path)
+        c.set_options(cache_enabled=True, pulling_timeout=1)
+        assert await c.get("app.properties", "sandbox") == "a=1"
+        hits = server.hits["/diamond-server/config.co"]
+        assert await c.get("app.properties", "sandbox") == "a=1"
+        assert server.hits["/diamond-server/config.co"] == hits
+        assert c.stats()["cache"]["hits"] == 1
+
+        received = list()
+
+        def cb(x):
+            received.append(x["content"])
+
+        c.add_watcher("app.properties", "sandbox", cb)
+        await asyncio.sleep(0.5)
+        server.set_config("app.properties", "sandbox", "a=2")
+        await asyncio.sleep(0.5)
+        assert received[-1] == "a=2"
+        hits = server.hits["/diamond-server/config.co"]
+        assert await c.get("app.properties", "sandbox") == "a=2"
+        assert server.hits["/diamond-server/config.co"] == hits
+
+        await c.publish("app.properties", "sandbox", "a=3")
+        assert await c.get("app.properties", "sandbox") == "a=3"
+        await c.remove_watcher("app.properties", "sandbox", cb)
+        await c.close()
+
+
+async def test_get_many(tmp_path):
+    async with StubServer() as server:
+        for i in range(5):
+            server.set_config("app-%s.properties" % i, "sandbox", "a=%s" % i)
+        c = make_client(server, tmp_path)
+        keys = [("app-%s.properties" % i, "sandbox") for i in range(5)]
+        values, errors = await c.get_many(keys + [("bad key", None)], concurrency=2)
+        assert values == {k: "a=%s" % i for i, k in enumerate(keys)}
+        assert list(errors) == [("bad key", None)]
+        assert isinstance(errors[("bad key", None)], aioacm.ACMException)
+        assert (tmp_path / "snapshot").exists()
+        await c.close()
+
+        # option no_snapshot applies unless overridden
+        c = make_client(server, tmp_path / "other")
+        c.set_options(no_snapshot=True)
+        values, errors = await c.get_many(keys)
+        assert len(values) == 5 and not errors
+        assert not (tmp_path / "other" / "snapshot").exists()
+        await c.close()
+
+
+async def test_list_all(tmp_path):
+    async with StubServer() as server:
+        for i in range(25):
+            server.set_config("app-%02d.properties" % i, "g%s" % (i % 2), "a=%s" % i)
+        c = make_client(server, tmp_path)
+        items = await c.list_all(concurrency=3, page_size=4)
+        assert [i["dataId"] for i in items] == sorted(
+            "app-%02d.properties" % i for i in range(25))
+        assert server.hits["/diamond-server/basestone.do"] == 7
+        items = await c.list_all(group="g1", prefix="app-1", page_size=4)
+        assert items == [{"dataId": "app-%02d.properties" % i, "group": "g1"} for i in (11, 13, 15, 17, 19)]
+        await c.close()
+
+
+async def test_iter_configs(tmp_path):
+    async with StubServer() as server:
+        for i in range(30):
+            server.set_config("app-%02d.properties" % i, "sandbox", "a=%s" % i)
+        c = make_client(server, tmp_path)
+        configs = c.iter_configs(read_ahead=2, page_size=5)
+        items = list()
+        async for item in configs:
+            # pages requested are bounded by the current page and the read ahead window
+            assert server.hits["/diamond-server/basestone.do"] <= len(items) // 5 + 1 + 2
+            items.append(item)
+        assert configs.total_count == 30
+        assert len(items) == 30
+        items = list()
+        async for item in c.iter_configs(prefix="app-1", page_size=5):
+            items.append(item)
+        assert [i["content"] for i in items] == ["a=%s" % i for i in range(10, 20)]
+        assert items[0]["md5"] == stub.md5("a=10")
+
+        # pages requested ahead are cancelled when the loop stops early
+        async with c.iter_configs(read_ahead=3, page_size=5) as configs:
+            async for item in configs:
+                fetching = list(configs._fetching)
+                break
+        assert fetching and not configs._fetching
+        await asyncio.sleep(0)
+        assert all(f.done() for f in fetching)
+        await c.close()
+
+
+async def test_get_all(tmp_path):
+    async with StubServer() as server:
+        for i in range(30):
+            server.set_config("app-%02d.properties" % i, "sandbox", "a=%s" % i)
+        server.set_config("big.properties", "sandbox", "b" * 100)
+        server.list_content_limit = 50
+        c = make_client(server, tmp_path)
+        c.set_options(cache_enabled=True)
+        items = await c.get_all(verify_md5=True, page_size=10)
+        assert len(items) == 31
+        assert items[-1] == {"dataId": "big.properties", "group": "sandbox", "content": "b" * 100}
+        # 4 pages, and only the truncated one is got by key
+        assert server.hits["/diamond-server/basestone.do"] == 4
+        assert server.hits["/diamond-server/config.co"] == 1
+        assert await c.get("app-00.properties", "sandbox") == "a=0"
+        assert server.hits["/diamond-server/config.co"] == 1
+        await c.close()
+
+
+async def test_warm_start(tmp_path):
+    async with StubServer() as server:
+        server.set_config("app.properties", "sandbox", "a=1")
+        server.set_config("db.properties", "sandbox", "b=1")
+        c = make_client(server, tmp_path)
+        c.set_options(pulling_timeout=1, warm_values_ttl=0.2)
+        files.save_file(c.snapshot_base, str(c._config_key("app.properties", "sandbox")), "a=0")
+        values, refreshing = await c.warm_start([("app.properties", "sandbox"), ("db.properties", "sandbox")])
+        # local values are got with no server request
+        assert values == {("app.properties", "sandbox"): "a=0", ("db.properties", "sandbox"): None}
+        assert not server.hits
+        assert await refreshing == ({("app.properties", "sandbox"): "a=1",
+                                     ("db.properties", "sandbox"): "b=1"}, {})
+        received = list()
+        c.add_watcher("app.properties", "sandbox", lambda x: received.append(x["content"]))
+        await asyncio.sleep(0.3)
+        assert received == ["a=1"]
+        assert server.no_hang_ups == 0
+        # the value no watcher took is dropped
+        assert not c.warm_values
+        server.set_config("app.properties", "sandbox", "a=2")
+        await asyncio.sleep(0.3)
+        assert received == ["a=1", "a=2"]
+        await c.close()
+
+
+def kms_client(server, tmp_path):
+    c = make_client(server, tmp_path)
+    c.set_options(kms_enabled=True, kms_ak="ak", kms_secret="sk", region_id="cn-hangzhou", key_id="key")
+    return c
+
+
+async def test_kms(tmp_path, monkeypatch):
+    kms = FakeKMS(latency=0.01).install(monkeypatch)
+    async with StubServer() as server:
+        c = kms_client(server, tmp_path)
+        assert await c.publish("cipher-app.properties", "sandbox", "secret")
+        assert server.configs[("cipher-app.properties", "sandbox", "")] != "secret"
+        # plaintext published is cached
+        assert await c.get("cipher-app.properties", "sandbox") == "secret"
+        assert (kms.encrypts, kms.decrypts) == (1, 0)
+
+        other = kms_client(server, tmp_path)
+        for _ in range(3):
+            assert await other.get("cipher-app.properties", "sandbox") == "secret"
+        assert kms.decrypts == 1
+        # KMS is requested off the event loop
+        assert threading.get_ident() not in kms.threads
+
+        # items sharing a ciphertext are decrypted once, bad ones fail alone
+        blob = server.configs[("cipher-app.properties", "sandbox", "")]
+        server.set_config("cipher-copy.properties", "sandbox", blob)
+        server.set_config("cipher-bad.properties", "sandbox", "bad")
+        server.set_config("plain.properties", "sandbox", blob)
+        fresh = kms_client(server, tmp_path)
+        keys = [("cipher-app.properties", "sandbox"), ("cipher-copy.properties", "sandbox"),
+                ("cipher-bad.properties", "sandbox"), ("plain.properties", "sandbox")]
+        values, errors = await fresh.get_many(keys)
+        assert values == {keys[0]: "secret", keys[1]: "secret", keys[3]: blob}
+        assert list(errors) == [keys[2]]
+        assert kms.decrypts == 3
+        for client in (c, other, fresh):
+            await client.close()
+
+
+async def test_kms_watcher(tmp_path, monkeypatch):
+    kms = FakeKMS().install(monkeypatch)
+    async with StubServer() as server:
+        c = kms_client(server, tmp_path)
+        c.set_options(pulling_timeout=1)
+        await c.publish("cipher-app.properties", "sandbox", "secret")
+        received = list()
+        c.add_watcher("cipher-app.properties", "sandbox", lambda x: received.append(x["content"]))
+        await asyncio.sleep(0.3)
+        await c.publish("cipher-app.properties", "sandbox", "secret-2")
+        await asyncio.sleep(0.5)
+        assert received == ["secret", "secret-2"]
+        # md5 of the ciphertext is polled, an unchanged item hangs up
+        assert server.hits["/diamond-server/config.co"] <= 6
+
+        # a slow decrypt does not hold back events of other keys
+        server.set_config("app.properties", "sandbox", "a=1")
+        c.add_watcher("app.properties", "sandbox", lambda x: received.append(x["content"]))
+        # the key is probed once the current long polling returns
+        for _ in range(30):
+            if "a=1" in received:
+                break
+            await asyncio.sleep(0.05)
+        kms.latency = 0.5
+        server.set_config("cipher-app.properties", "sandbox", kms.encrypt_plain("secret-3"))
+        await asyncio.sleep(0.1)
+        server.set_config("app.properties", "sandbox", "a=2")
+        await asyncio.sleep(0.2)
+        assert received == ["secret", "secret-2", "a=1", "a=2"]
+        await asyncio.sleep(0.5)
+        assert received[-1] == "secret-3"
+        await c.close()
+
+
+async def test_kms_envelope(tmp_path, monkeypatch):
+    pytest.importorskip("cryptography")
+    kms = FakeKMS().install(monkeypatch)
+    async with StubServer() as server:
+        server.set_config("cipher-legacy.properties", "sandbox", kms.encrypt_plain("old"))
+        c = kms_client(server, tmp_path)
+        c.set_options(kms_envelope_enabled=True, data_key_lifetime=0.2, kms_cache_size=0)
+        for i in range(5):
+            assert await c.publish("cipher-%d.properties" % i, "sandbox", "secret-%d" % i)
+        blob = server.configs[("cipher-0.properties", "sandbox", "")]
+        assert blob.startswith("envelope:") and "secret" not in blob
+        # one data key seals every content within its lifetime
+        assert (kms.generates, kms.encrypts, kms.decrypts) == (1, 0, 0)
+        assert await c.get("cipher-0.properties", "sandbox") == "secret-0"
+        assert kms.decrypts == 0
+
+        await asyncio.sleep(0.3)
+        assert await c.publish("cipher-5.properties", "sandbox", "secret-5")
+        assert kms.generates == 2
+
+        # a wrapped key is decrypted once for all contents sealed by it
+        fresh = kms_client(server, tmp_path)
+        keys = [("cipher-%d.properties" % i, "sandbox") for i in range(6)]
+        values, errors = await fresh.get_many(keys + [("cipher-legacy.properties", "sandbox")])
+        assert not errors
+        assert [values[k] for k in keys] == ["secret-%d" % i for i in range(6)]
+        assert values[("cipher-legacy.properties", "sandbox")] == "old"
+        assert kms.decrypts == 3
+        # the synchronous API opens envelopes too
+        assert fresh.decrypt(blob) == "secret-0"
+        for client in (c, fresh):
+            await client.close()
+
+
+@pytest.mark.parametrize("keep_content", [True, False])
+async def test_watcher_added_later(tmp_path, keep_content):
+    async with StubServer() as server:
+        server.set_config("app.properties", "sandbox", "a=1")
+        c = make_client(server, tmp_path)
+        c.set_options(pulling_timeout=1, keep_watched_content=keep_content)
+        first, second = list(), list()
+
+        def cb1(x):
+            first.append(x["content"])
+
+        def cb2(x):
+            second.append(x["content"])
+
+        c.add_watcher("app.properties", "sandbox", cb1)
+        await asyncio.sleep(0.3)
+        key = c._config_key("app.properties", "sandbox")
+        cache_data = c.puller_pool.get(key).cache_pool[key]
+        assert cache_data.content == ("a=1" if keep_content else None)
+        c.add_watcher("app.properties", "sandbox", cb2)
+        await asyncio.sleep(0.3)
+        assert first == ["a=1"] and second == ["a=1"]
+        server.set_config("app.properties", "sandbox", "a=2")
+        await asyncio.sleep(0.3)
+        assert first == ["a=1", "a=2"] and second == ["a=1", "a=2"]
+        await c.remove_watcher("app.properties", "sandbox", cb1)
+        await c.remove_watcher("app.properties", "sandbox", cb2)
+        await c.close()
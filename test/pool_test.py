@@ -0,0 +1,52 @@
+# -*- coding: utf8 -*-
+
+import asyncio
+
+import pytest
+
+from aioacm.pool import PullerPool
+
+pytestmark = pytest.mark.asyncio
+
+
+async def idle(puller):
+    await asyncio.sleep(3600)
+
+
+async def test_assign_and_compact():
+    pool = PullerPool(4, idle)
+    for i in range(10):
+        pool.add("key-%s" % i)
+    assert len(pool.pullers) == 3
+    assert sorted(len(p.keys) for p in pool.pullers) == [2, 4, 4]
+    first = pool.get("key-0")
+    first.cache_pool["key-3"] = "cache data"
+    for i in range(2):
+        pool.remove("key-%s" % i)
+    # the half-empty puller is kept while others have no room for its keys
+    assert len(pool.pullers) == 3
+    pool.remove("key-2")
+    # key-3 moves to the last puller with its cache data, first one is stopped
+    assert len(pool.pullers) == 2
+    assert pool.get("key-3") is not first and pool.get("key-3").cache_pool["key-3"] == "cache data"
+    await asyncio.sleep(0)
+    assert first.task.cancelled()
+    assert sorted(len(p.keys) for p in pool.pullers) == [3, 4]
+    pool.stop()
+
+
+async def test_restart_on_failure():
+    runs = list()
+
+    async def fail_once(puller):
+        runs.append(puller)
+        if len(runs) == 1:
+            raise ValueError("puller failed")
+        await asyncio.sleep(3600)
+
+    pool = PullerPool(4, fail_once)
+    puller = pool.add("key")
+    await asyncio.sleep(0.01)
+    assert runs == [puller, puller]
+    pool.remove("key")
+    assert not pool.pullers
@@ -0,0 +1,86 @@
+# -*- coding: utf8 -*-
+
+import time
+
+import pytest
+
+from aioacm.selector import ServerSelector
+
+A = ("10.0.0.1", 8080, True)
+B = ("10.0.0.2", 8080, True)
+C = ("10.0.0.3", 8080, True)
+
+
+def test_select_by_score():
+    selector = ServerSelector(alpha=0.5)
+    # unknown servers score 0, current one wins ties
+    assert selector.select([A, B, C], current=B) == B
+    selector.record(A, 0.1)
+    selector.record(B, 0.5)
+    selector.record(C, 0.2)
+    assert selector.select([A, B, C], current=B) == A
+    selector.record(A, 0.5)
+    assert selector.score(A) == pytest.approx(0.3)
+    assert selector.select([A, B, C]) == C
+    assert selector.select([A, B, C], exclude={A, C}) == B
+    assert selector.select([A, B, C], exclude={A, B, C}) is None
+
+
+def test_errors_and_retain():
+    selector = ServerSelector(alpha=0.5, error_cost=10)
+    selector.record(A, 0.01)
+    selector.record(B, 0.5)
+    selector.record(A, error=True)
+    assert selector.score(A) == pytest.approx(0.01 + 5)
+    assert selector.select([A, B]) == B
+    for _ in range(4):
+        selector.record(A, 0.01)
+    # error rate of A decays to 1/32
+    assert selector.select([A, B]) == A
+    selector.retain([B])
+    assert A not in selector.stats and selector.score(A) == 0
+
+
+def test_explore():
+    selector = ServerSelector(explore_interval=0.05)
+    selector.record(A, 0.01)
+    selector.record(B, 1)
+    assert [selector.select([A, B]) for _ in range(3)] == [A, A, A]
+    time.sleep(0.05)
+    # B is picked once after the interval, A is still picked on every call
+    assert [selector.select([A, B]) for _ in range(3)] == [B, A, A]
+
+
+def test_circuit_breaker():
+    selector = ServerSelector(breaker_threshold=2, breaker_cooldown=0.05, breaker_max_cooldown=0.15)
+    selector.record(A, 0.01)
+    selector.record(B, 0.5)
+    selector.record(A, error=True)
+    assert not selector.is_open(A)
+    selector.record(A, error=True)
+    assert selector.is_open(A)
+    assert selector.select([A, B]) == B
+    assert selector.select([A]) is None
+
+    time.sleep(0.05)
+    # one probe is let through after the cool-down
+    assert selector.select([A, B]) == A
+    assert selector.select([A, B]) == B
+    selector.record(A, error=True)
+    assert selector.stats[A].cooldown == 0.1
+    time.sleep(0.1)
+    assert selector.select([A, B]) == A
+    selector.record(A, error=True)
+    assert selector.stats[A].cooldown == 0.15
+    time.sleep(0.15)
+    assert selector.select([A, B]) == A
+    selector.record(A, 0.01)
+    assert not selector.is_open(A) and selector.stats[A].failures == 0
+
+
+def test_trip():
+    selector = ServerSelector(breaker_cooldown=0.01, breaker_max_cooldown=60)
+    selector.trip(A, 30)
+    assert selector.is_open(A) and selector.stats[A].cooldown == 30
+    selector.trip(B, 3600)
+    assert selector.stats[B].cooldown == 60
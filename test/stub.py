@@ -0,0 +1,172 @@
+# -*- coding: utf8 -*-
+"""A local stand-in of the ACM diamond server, used by tests and benchmarks."""
+
+import json
+import asyncio
+import hashlib
+from urllib.parse import parse_qsl, quote_plus
+
+from aiohttp import web
+
+WORD_SEPARATOR = u'\x02'
+LINE_SEPARATOR = u'\x01'
+
+
+def md5(content):
+    return hashlib.md5(content.encode("GBK")).hexdigest()
+
+
+class StubServer:
+    """ACM server stub serving configs from memory.
+
+    * ``latency`` - seconds to sleep before answering non long-polling
+      requests, or a function returning it to vary latency per request.
+    * ``connections`` - set of client peers seen, one per TCP connection.
+    * ``hits`` - number of requests per path.
+    * ``list_content_limit`` - contents longer than it are truncated in
+      list pages, md5 of pages is always of the full content.
+    * ``no_hang_ups`` - number of long polling requests asking not to hang up.
+    * ``retry_after`` - if set, non long-polling requests are answered 503
+      with it as Retry-After.
+    """
+
+    def __init__(self, latency=0):
+        self.configs = dict()
+        self.latency = latency
+        self.connections = set()
+        self.hits = dict()
+        self.list_content_limit = None
+        self.retry_after = None
+        self.no_hang_ups = 0
+        self.port = None
+        self.runner = None
+        self.version = None
+
+    @property
+    def endpoint(self):
+        return "127.0.0.1:%s" % self.port
+
+    def set_config(self, data_id, group, content, tenant=""):
+        self.configs[(data_id, group, tenant)] = content
+        self._notify()
+
+    def delete_config(self, data_id, group, tenant=""):
+        self.configs.pop((data_id, group, tenant), None)
+        self._notify()
+
+    def _notify(self):
+        if self.version is not None:
+            self.version.set()
+            self.version = asyncio.Event()
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/diamond-server/diamond", self.address)
+        app.router.add_get("/diamond-server/config.co", self.get_config)
+        app.router.add_post("/diamond-server/config.co", self.listen)
+        app.router.add_get("/diamond-server/basestone.do", self.list_configs)
+        app.router.add_post("/diamond-server/basestone.do", self.publish)
+        app.router.add_post("/diamond-server/datum.do", self.remove)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", self.port or 0)
+        await site.start()
+        self.port = self.runner.addresses[0][1]
+        self.version = asyncio.Event()
+        return self
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    async def _accept(self, request):
+        self.connections.add(request.transport.get_extra_info("peername"))
+        self.hits[request.path] = self.hits.get(request.path, 0) + 1
+        latency = self.latency() if callable(self.latency) else self.latency
+        if latency:
+            await asyncio.sleep(latency)
+        if self.retry_after is not None:
+            raise web.HTTPServiceUnavailable(headers={"Retry-After": str(self.retry_after)})
+
+    async def _form(self, request):
+        return dict(parse_qsl((await request.read()).decode("GBK")))
+
+    async def address(self, request):
+        await self._accept(request)
+        return web.Response(text=self.endpoint)
+
+    async def get_config(self, request):
+        await self._accept(request)
+        q = request.query
+        key = (q["dataId"], q["group"], q.get("tenant", ""))
+        if key not in self.configs:
+            raise web.HTTPNotFound()
+        return web.Response(text=self.configs[key])
+
+    def _changed(self, probe):
+        changed = list()
+        for line in probe.split(LINE_SEPARATOR):
+            if not line:
+                continue
+            sp = line.split(WORD_SEPARATOR)
+            data_id, group, last_md5 = sp[:3]
+            tenant = sp[3] if len(sp) > 3 else ""
+            content = self.configs.get((data_id, group, tenant))
+            if (md5(content) if content is not None else "") != last_md5:
+                changed.append(WORD_SEPARATOR.join([data_id, group, tenant]))
+        return changed
+
+    async def listen(self, request):
+        self.connections.add(request.transport.get_extra_info("peername"))
+        self.hits[request.path] = self.hits.get(request.path, 0) + 1
+        probe = (await self._form(request))["Probe-Modify-Request"]
+        timeout = int(request.headers.get("longPullingTimeout", "30000")) / 1000
+        hang_up = request.headers.get("longPullingNoHangUp") != "true"
+        self.no_hang_ups += not hang_up
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + timeout
+        changed = self._changed(probe)
+        while not changed and hang_up and loop.time() < deadline:
+            try:
+                await asyncio.wait_for(self.version.wait(), deadline - loop.time())
+            except asyncio.TimeoutError:
+                break
+            changed = self._changed(probe)
+        body = "".join(i + LINE_SEPARATOR for i in changed)
+        return web.Response(text=quote_plus(body))
+
+    async def list_configs(self, request):
+        await self._accept(request)
+        q = request.query
+        tenant = q.get("tenant", "")
+        page_no, page_size = int(q["pageNo"]), int(q["pageSize"])
+        keys = sorted(k for k in self.configs if k[2] == tenant)
+        items = [
+            {"dataId": k[0], "group": k[1], "tenant": tenant,
+             "content": self.configs[k][:self.list_content_limit], "md5": md5(self.configs[k])}
+            for k in keys[(page_no - 1) * page_size:page_no * page_size]
+        ]
+        return web.json_response({
+            "totalCount": len(keys),
+            "pageNumber": page_no,
+            "pagesAvailable": (len(keys) + page_size - 1) // page_size,
+            "pageItems": items,
+        }, dumps=json.dumps)
+
+    async def publish(self, request):
+        await self._accept(request)
+        form = await self._form(request)
+        self.set_config(form["dataId"], form["group"], form["content"],
+                        form.get("tenant", ""))
+        return web.Response(text="true")
+
+    async def remove(self, request):
+        await self._accept(request)
+        form = await self._form(request)
+        self.delete_config(form["dataId"], form["group"], form.get("tenant", ""))
+        return web.Response(text="true")
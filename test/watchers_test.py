@@ -0,0 +1,29 @@
+# -*- coding: utf8 -*-
+
+from aioacm.watchers import WatcherMapping
+
+
+def test_watcher_mapping():
+    def cb1(x):
+        pass
+
+    def cb2(x):
+        pass
+
+    mapping = WatcherMapping()
+    mapping.add("key", cb1)
+    mapping.add("key", cb1)
+    assert [(w.callback, w.count) for w in mapping.get("key")] == [(cb1, 2)]
+    mapping.add("key", cb2)
+    assert mapping.count("key") == 3
+    assert [w.callback for w in mapping.get("key")] == [cb1, cb2]
+
+    assert mapping.remove("key", cb1) == 1
+    assert mapping.count("key") == 2
+    assert mapping.remove("key", cb1) == 1
+    assert [w.callback for w in mapping.get("key")] == [cb2]
+    assert mapping.remove("key", cb1) == 0
+
+    mapping.add("key", cb2)
+    assert mapping.remove("key", cb2, remove_all=True) == 2
+    assert "key" not in mapping and not mapping.get("key")